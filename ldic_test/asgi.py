@@ -5,6 +5,35 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+The read-only JSON endpoints (/api/posts, /api/posts/<id> and
+/api/posts/likes) are async views: served through this callable they await
+the database instead of holding a thread per request, so one worker process
+can serve many concurrent API clients. Every middleware in settings is
+async-capable, so requests don't switch between sync and async on the way.
+The other views are synchronous and run in Django's thread pool.
+
+/api/posts/events streams like and repost counts as server-sent events. Here
+each open stream is a coroutine waiting on the in-process hub of
+mainapp/events.py, so thousands of clients don't need thousands of threads.
+The hub is per process: with several workers, a client only sees changes
+made through the worker it is connected to. Under WSGI the endpoint sends
+the counts once and lets the browser reconnect instead of streaming.
+
+To deploy, install an ASGI server and point it at this module, e.g.:
+
+    pip install "uvicorn[standard]" gunicorn
+    gunicorn ldic_test.asgi:application -k uvicorn.workers.UvicornWorker -w 4
+
+or, for a single process, ``uvicorn ldic_test.asgi:application``. Static files
+are served by the application itself, under ASGI as under WSGI: run
+collectstatic on every deploy (STATIC_ROOT isn't committed), and
+StaticFilesMiddleware (mainapp/assets.py) sends it with immutable caching and
+gzip. Set STATIC_SERVE = False to
+leave them to a web server in front instead.
+
+``python manage.py benchmark --asgi`` drives the same scenarios through the
+ASGI handler, to compare with the default WSGI run.
 """
 
 import os
@@ -14,3 +43,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ldic_test.settings')
 
 application = get_asgi_application()
+
+# Read the reverse geocoding gazetteer while the worker starts rather than
+# inside the first request that posts a location (see mainapp/geocoding.py).
+from mainapp.geocoding import get_gazetteer  # noqa: E402
+
+get_gazetteer()
@@ -44,6 +44,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # After SecurityMiddleware so static responses get its headers and
+    # redirects too, before anything that isn't needed to send a file.
+    "mainapp.assets.StaticFilesMiddleware",
+    "mainapp.metrics.MetricsMiddleware",
+    "mainapp.routers.ReadReplicaMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -82,6 +87,56 @@ DATABASES = {
     }
 }
 
+# Production SQLite: WAL so readers aren't blocked by the writer, pragmas
+# applied on every new connection, connections kept across requests, and
+# a read-only "replica" alias on the same file that takes the reads of
+# DATABASE_REPLICA_VIEWS (see mainapp/routers.py). SQLITE_PRODUCTION=0 in the
+# environment falls back to stock settings.
+SQLITE_PRODUCTION = os.environ.get("SQLITE_PRODUCTION", "1") != "0"
+SQLITE_PRAGMAS = [
+    "synchronous=NORMAL",
+    "busy_timeout=5000",
+    "mmap_size=268435456",
+    "cache_size=-20000",
+    "temp_store=MEMORY",
+]
+
+if SQLITE_PRODUCTION:
+    DATABASES["default"].update({
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "init_command": ";".join(f"PRAGMA {pragma}" for pragma in ["journal_mode=WAL", *SQLITE_PRAGMAS]),
+            # Take the write lock when the transaction starts instead of
+            # failing with "database is locked" when a reader upgrades.
+            "transaction_mode": "IMMEDIATE",
+        },
+    })
+    DATABASES["replica"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": f"file:{DATABASES['default']['NAME']}?mode=ro",
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "init_command": ";".join(f"PRAGMA {pragma}" for pragma in ["query_only=ON", *SQLITE_PRAGMAS]),
+        },
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_ROUTERS = ["mainapp.routers.ReadReplicaRouter"]
+
+DATABASE_REPLICA_VIEWS = [
+    "dashboard",
+    "detailed_post",
+    "all_post",
+    "post_detailed",
+    "post_batch",
+    "trending_post",
+    "post_like_state",
+    "nearby_post",
+    "search_post",
+    "post_thread_json",
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -120,10 +175,137 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# collectstatic writes content-hashed copies and their .gz variants, which
+# StaticFilesMiddleware serves from STATIC_ROOT with Cache-Control: immutable.
+# STATIC_ROOT is build output and not committed: run collectstatic as part
+# of every deploy.
+# Files requested by their unhashed name are cached for STATIC_MAX_AGE seconds.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "mainapp.assets.CompressedManifestStaticFilesStorage",
+    },
+}
+STATIC_SERVE = True
+STATIC_MAX_AGE = 3600
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Write-behind buffering of like toggles (see mainapp/likes.py). Toggles are
+# coalesced in memory and written in batches every LIKE_BUFFER_FLUSH_INTERVAL
+# seconds or once LIKE_BUFFER_MAX_PENDING toggles are queued.
+LIKE_BUFFER_ENABLED = False
+LIKE_BUFFER_MAX_PENDING = 500
+LIKE_BUFFER_FLUSH_INTERVAL = 1.0
+
+# Offline reverse geocoding (see mainapp/geocoding.py). Point this at a
+# GeoNames dump such as https://download.geonames.org/export/dump/cities500.zip
+# (unzipped) or a CSV with name,country,lat,lon columns. wsgi.py and asgi.py
+# load it when a worker starts.
+GEOCODER_GAZETTEER = BASE_DIR / "data" / "cities500.txt"
+GEOCODER_MAX_DISTANCE_KM = 100
+
+# Seconds an assembled repost thread stays cached (see mainapp/threads.py).
+THREAD_CACHE_TIMEOUT = 60
+
+# Seconds a rendered post snippet stays cached (see mainapp/templatetags/snippets.py).
+SNIPPET_CACHE_TIMEOUT = 300
+
+# The dashboard reads its post count from the cache, counting again after
+# TIMELINE_COUNT_TIMEOUT seconds, and seeks on post_id instead of using
+# OFFSET past page TIMELINE_SEEK_FROM (see mainapp/pagination.py).
+TIMELINE_COUNT_TIMEOUT = 300
+TIMELINE_SEEK_FROM = 20
+
+# Trending scores (see mainapp/models.py TrendingScore): a like counts
+# TRENDING_LIKE_WEIGHT, a repost TRENDING_REPOST_WEIGHT, and both halve every
+# TRENDING_HALF_LIFE seconds. decay_trending drops scores below
+# TRENDING_MIN_SCORE.
+TRENDING_LIKE_WEIGHT = 1.0
+TRENDING_REPOST_WEIGHT = 3.0
+TRENDING_HALF_LIFE = 6 * 3600
+TRENDING_MIN_SCORE = 0.01
+
+# Bearer token that lets analytics jobs read /api/posts/export without a
+# staff session; unset, only staff can export.
+EXPORT_TOKEN = os.environ.get("EXPORT_TOKEN")
+
+# Like and repost count changes streamed on /api/posts/events are merged per
+# post and sent at most once per this many seconds (see mainapp/events.py).
+EVENTS_COALESCE_WINDOW = 0.25
+
+# Per-view request metrics served on /metrics (see mainapp/metrics.py). A view
+# running more queries than its budget here logs a warning. Only staff and
+# scrapers sending Authorization: Bearer <METRICS_TOKEN> can read them. The
+# numbers are kept per process, so with several workers a scrape only sees
+# the worker that answered it.
+METRICS_ENABLED = True
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+METRICS_QUERY_BUDGETS = {
+    "dashboard": 10,
+    "detailed_post": 10,
+    "post_like": 12,
+    "all_post": 4,
+    "post_detailed": 3,
+    "post_batch": 2,
+    "trending_post": 2,
+    "post_like_state": 3,
+    "post_events": 1,
+    "nearby_post": 3,
+    "search_post": 3,
+}
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "mainapp": {"handlers": ["console"], "level": "INFO"},
+    },
+}
+
+# Set REDIS_URL to share one cache between the worker processes, so that
+# invalidations (threads, users, sessions) reach every one of them. Without
+# it each process keeps its own in-memory cache: cheap, but another worker
+# only notices a change once its copy times out (USER_CACHE_TIMEOUT,
+# THREAD_CACHE_TIMEOUT, TIMELINE_COUNT_TIMEOUT). Test runs swap in a private
+# in-memory cache (see TEST_RUNNER below).
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
+
+TEST_RUNNER = "mainapp.testing.TestRunner"
+
+# Sessions and request.user come from the cache (see mainapp/backends.py),
+# so an authenticated request costs no queries before the view runs. A
+# per-process cache would keep a session alive in the other workers after
+# logging out, so sessions are only cached when the cache is shared.
+if os.environ.get("REDIS_URL"):
+    SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+AUTHENTICATION_BACKENDS = [
+    "mainapp.backends.CachedModelBackend",
+    # Still accepted for sessions logged in before the cached backend.
+    "django.contrib.auth.backends.ModelBackend",
+]
+USER_CACHE_TIMEOUT = 60
+
 AUTH_USER_MODEL = "mainapp.User"
 LOGIN_URL = "login"
\ No newline at end of file
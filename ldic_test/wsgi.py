@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ldic_test.settings')
 
 application = get_wsgi_application()
+
+# Read the reverse geocoding gazetteer while the worker starts rather than
+# inside the first request that posts a location (see mainapp/geocoding.py).
+from mainapp.geocoding import get_gazetteer  # noqa: E402
+
+get_gazetteer()
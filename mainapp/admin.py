@@ -2,9 +2,18 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
 from .models import User, Post
+from .moderation import ban_users
+
+@admin.action(description="Ban the selected users and their posts")
+def ban_selected_users(modeladmin, request, queryset):
+    banned = ban_users(queryset.values_list("pk", flat=True))
+    modeladmin.message_user(request, f"Banned {queryset.count()} users and {banned} posts.")
+
+class ModeratedUserAdmin(admin.ModelAdmin):
+    actions = [ban_selected_users]
 
 # Register your models here.
-admin.site.register(User)
+admin.site.register(User, ModeratedUserAdmin)
 admin.site.register(Post)
 
 class CustomUserAdmin(UserAdmin):
@@ -0,0 +1,245 @@
+import gzip
+import json
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+
+# Text formats worth precompressing; images and fonts are already compressed.
+COMPRESSIBLE = (".css", ".js", ".map", ".svg", ".txt", ".json", ".html", ".xml")
+COMPRESS_MIN_SIZE = 256
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that also writes a gzip copy (name.gz) of
+    every text file collectstatic produces, for StaticFilesMiddleware to
+    send to clients that accept it.
+
+    References to files that aren't shipped (the bootstrap-icons fonts) are
+    left as they are instead of failing collectstatic, and a name missing
+    from the manifest falls back to its unhashed URL.
+    """
+    manifest_strict = False
+
+    def url_converter(self, name, hashed_files, template=None):
+        convert = super().url_converter(name, hashed_files, template)
+
+        def converter(matchobj):
+            try:
+                return convert(matchobj)
+            except ValueError:
+                return matchobj.group(0)
+
+        return converter
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+
+        for name in {*self.hashed_files.keys(), *self.hashed_files.values()}:
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name):
+        path = self.path(name)
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return
+        # mtime=0 so running collectstatic again writes identical files.
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) < len(data):
+            with open(path + ".gz", "wb") as f:
+                f.write(compressed)
+
+
+class StaticFile:
+    __slots__ = ("path", "size", "mtime", "content_type", "etag", "immutable", "_data")
+
+    def __init__(self, path, immutable):
+        self.path = path
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+            content_type += "; charset=utf-8"
+        self.content_type = content_type
+        self.immutable = immutable
+        self._data = None
+        self._stat(os.stat(path))
+
+    def _stat(self, stat):
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.etag = f'"{int(self.mtime):x}-{self.size:x}"'
+
+    def load(self):
+        """
+        Read the file into memory the first time it is served. Responses
+        then come from those bytes, so collectstatic replacing the file
+        under a running worker can't truncate or mix them, and the size and
+        ETag are taken from the file that was actually read.
+        """
+        if self._data is None:
+            with open(self.path, "rb") as f:
+                self._stat(os.fstat(f.fileno()))
+                self._data = f.read()
+            self.size = len(self._data)
+        return self._data
+
+    def read(self, start=0, end=None):
+        return self.load()[start:end]
+
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_range(header, size):
+    """(start, end) of a single byte range, None if absent, False if unsatisfiable."""
+    match = _RANGE.match(header.strip())
+    if match is None:
+        # Multiple or malformed ranges: send the whole file.
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        start, end = max(size - int(last), 0), size
+    else:
+        start = int(first)
+        end = min(int(last) + 1, size) if last else size
+    if start >= size or start >= end:
+        return False
+    return start, end
+
+
+def _accepts_gzip(request):
+    for coding in request.headers.get("Accept-Encoding", "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+class StaticFilesMiddleware:
+    """
+    Serves STATIC_ROOT from the application, so static files work with
+    DEBUG = False and no web server in front.
+
+    Files are indexed once at startup and kept in memory once served, see
+    StaticFile.load(). STATIC_ROOT isn't in the repository: run
+    collectstatic when deploying, before the workers start. Names in the
+    collectstatic manifest carry their content hash and are sent with
+    Cache-Control: immutable; the others get STATIC_MAX_AGE and ETag /
+    Last-Modified revalidation. The .gz copies written by
+    CompressedManifestStaticFilesStorage are sent to clients that accept
+    gzip, and single byte ranges are answered with 206.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        root = settings.STATIC_ROOT
+        if not getattr(settings, "STATIC_SERVE", True) or not root or not os.path.isdir(root):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL if settings.STATIC_URL.startswith("/") else "/" + settings.STATIC_URL
+        self.max_age = getattr(settings, "STATIC_MAX_AGE", 3600)
+        self.files = self.index(root)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def index(self, root):
+        hashed = set()
+        manifest = os.path.join(root, "staticfiles.json")
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                hashed.update(json.load(f).get("paths", {}).values())
+
+        files = dict()
+        for directory, _, names in os.walk(root):
+            for name in names:
+                path = os.path.join(directory, name)
+                url_name = os.path.relpath(path, root).replace(os.sep, "/")
+                files[url_name] = StaticFile(path, url_name in hashed)
+        return files
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.serve(request)
+        if response is None:
+            response = self.get_response(request)
+        return response
+
+    async def __acall__(self, request):
+        response = self.serve(request)
+        if response is None:
+            response = await self.get_response(request)
+        return response
+
+    def serve(self, request):
+        if request.method not in ("GET", "HEAD") or not request.path_info.startswith(self.prefix):
+            return None
+        name = request.path_info[len(self.prefix):]
+        static_file = self.files.get(name)
+        if static_file is None or name.endswith(".gz"):
+            return None
+
+        compressed = self.files.get(name + ".gz")
+        if compressed is not None and ("Range" in request.headers or not _accepts_gzip(request)):
+            compressed = None
+        try:
+            for loaded in (static_file, compressed):
+                if loaded is not None:
+                    loaded.load()
+        except OSError:
+            # Removed since the index was built.
+            return None
+        # The gzip copy is another representation, so it gets its own ETag.
+        etag = static_file.etag if compressed is None else static_file.etag[:-1] + '-gzip"'
+
+        if request.headers.get("If-None-Match") == etag:
+            response = HttpResponse(status=304)
+        else:
+            response = self.file_response(request, compressed or static_file, static_file.size)
+            if compressed is not None:
+                response["Content-Type"] = static_file.content_type
+                response["Content-Encoding"] = "gzip"
+
+        response["ETag"] = etag
+        response["Last-Modified"] = formatdate(static_file.mtime, usegmt=True)
+        response["Cache-Control"] = IMMUTABLE if static_file.immutable else f"public, max-age={self.max_age}"
+        if name + ".gz" in self.files:
+            response["Vary"] = "Accept-Encoding"
+        return response
+
+    def file_response(self, request, static_file, size):
+        start, end, status = 0, static_file.size, 200
+        if "Range" in request.headers and request.headers.get("If-Range", static_file.etag) == static_file.etag:
+            byte_range = _parse_range(request.headers["Range"], size)
+            if byte_range is False:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{size}"
+                return response
+            if byte_range is not None:
+                (start, end), status = byte_range, 206
+
+        response = HttpResponse(
+            b"" if request.method == "HEAD" else static_file.read(start, end),
+            status=status,
+            content_type=static_file.content_type,
+        )
+        response["Content-Length"] = end - start
+        response["Accept-Ranges"] = "bytes"
+        if status == 206:
+            response["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        return response
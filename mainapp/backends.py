@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+def _user_key(user_id):
+    return f"auth-user:{user_id}"
+
+
+def invalidate_user(user_id):
+    """Drop the cached copy of a user; saving a User does it, see signals.py."""
+    cache.delete(_user_key(user_id))
+
+
+def invalidate_users(user_ids):
+    cache.delete_many([_user_key(user_id) for user_id in user_ids])
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that keeps the users it loads for request.user in the
+    cache for USER_CACHE_TIMEOUT seconds, so an authenticated request with a
+    cached session doesn't query the database before reaching the view.
+    """
+
+    def get_user(self, user_id):
+        key = _user_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, getattr(settings, "USER_CACHE_TIMEOUT", 60))
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        key = _user_key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is None:
+                return None
+            await cache.aset(key, user, getattr(settings, "USER_CACHE_TIMEOUT", 60))
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,412 @@
+import asyncio
+import copy
+import itertools
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, OperationalError, connection, connections, transaction
+from django.test import AsyncClient, Client, override_settings
+
+from . import metrics
+from .models import Post, User
+
+BENCHMARK_PASSWORD = "benchmark-password"
+
+WORDS = (
+    "coffee morning traffic rain sunset weekend football music concert city beach "
+    "train office lunch dinner market festival mountain river holiday news game"
+).split()
+
+
+def generate_dataset(users=100, posts=1000, likes=5000, repost_ratio=0.2, geotagged=0.3,
+                     like_exponent=1.1, prefix="bench", seed=0):
+    """
+    A seeded ingest batch (see mainapp.ingest.ingest): the same arguments
+    always give the same batch.
+
+    Posters are picked uniformly. ``repost_ratio`` of the posts repost an
+    earlier post of the batch and ``geotagged`` of them have a location.
+    Likes follow a power law: the post of popularity rank r is picked with
+    weight 1 / r ** ``like_exponent``. Every user gets BENCHMARK_PASSWORD.
+    """
+    rng = random.Random(seed)
+    # Hashing is deliberately slow, so every user shares one hash, salted
+    # from the seed to keep the batch reproducible.
+    password_hash = make_password(BENCHMARK_PASSWORD, salt=f"benchmark{seed}")
+    usernames = [f"{prefix}{i}" for i in range(users)]
+
+    batch_posts = list()
+    for i in range(posts):
+        row = {
+            "ref": i,
+            "poster": rng.choice(usernames),
+            "post_content": f"Post {i}: " + " ".join(rng.choices(WORDS, k=rng.randint(3, 12))),
+        }
+        if i and rng.random() < repost_ratio:
+            row["repost_ref"] = rng.randrange(i)
+        if rng.random() < geotagged:
+            row["loc_lat"] = round(rng.uniform(-60, 70), 6)
+            row["loc_lon"] = round(rng.uniform(-180, 180), 6)
+        batch_posts.append(row)
+
+    batch_likes = list()
+    if posts and users:
+        ranking = list(range(posts))
+        rng.shuffle(ranking)
+        weights = list(itertools.accumulate(1 / (rank + 1) ** like_exponent for rank in range(posts)))
+        seen = set()
+        for _ in range(likes):
+            post_ref = ranking[rng.choices(range(posts), cum_weights=weights)[0]]
+            username = rng.choice(usernames)
+            if (post_ref, username) not in seen:
+                seen.add((post_ref, username))
+                batch_likes.append({"user": username, "post_ref": post_ref})
+
+    return {
+        "users": [
+            {
+                "username": username,
+                "email": f"{username}@example.com",
+                "display_name": f"Benchmark {username}",
+                "password_hash": password_hash,
+            }
+            for username in usernames
+        ],
+        "posts": batch_posts,
+        "likes": batch_likes,
+    }
+
+
+def dashboard(rng, post_ids, page_count):
+    return "get", f"/?page={rng.randint(1, page_count)}"
+
+def detailed_post(rng, post_ids, page_count):
+    return "get", f"/post/{rng.choice(post_ids)}"
+
+def toggle_like(rng, post_ids, page_count):
+    return "post", f"/post/{rng.choice(post_ids)}/like/"
+
+def all_post_json(rng, post_ids, page_count):
+    return "get", f"/api/posts?page={rng.randrange(page_count)}"
+
+def post_json(rng, post_ids, page_count):
+    return "get", f"/api/posts/{rng.choice(post_ids)}"
+
+SCENARIOS = {
+    "dashboard": dashboard,
+    "detailed_post": detailed_post,
+    "toggle_like": toggle_like,
+    "all_post_json": all_post_json,
+    "post_json": post_json,
+}
+
+
+def _percentile(latencies, q):
+    if len(latencies) == 1:
+        return latencies[0]
+    return statistics.quantiles(latencies, n=100, method="inclusive")[q - 1]
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _worker(scenario, requests, user_ids, post_ids, page_count, seed):
+    rng = random.Random(seed)
+    client = Client(raise_request_exception=False)
+    client.force_login(User.objects.get(pk=rng.choice(user_ids)))
+
+    latencies = list()
+    errors = 0
+    try:
+        for _ in range(requests):
+            method, url = scenario(rng, post_ids, page_count)
+            started = time.perf_counter()
+            response = getattr(client, method)(url)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+    finally:
+        connection.close()
+
+    return latencies, errors
+
+
+async def _async_worker(scenario, requests, user_ids, post_ids, page_count, seed):
+    rng = random.Random(seed)
+    client = AsyncClient(raise_request_exception=False)
+    await client.aforce_login(await User.objects.aget(pk=rng.choice(user_ids)))
+
+    latencies = list()
+    errors = 0
+    for _ in range(requests):
+        method, url = scenario(rng, post_ids, page_count)
+        started = time.perf_counter()
+        response = await getattr(client, method)(url)
+        latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors += 1
+
+    return latencies, errors
+
+
+async def _run_async_workers(scenario, per_worker, user_ids, post_ids, page_count, seed):
+    return await asyncio.gather(*(
+        _async_worker(scenario, requests, user_ids, post_ids, page_count, seed + i + 1)
+        for i, requests in enumerate(per_worker)
+    ))
+
+
+def run_scenario(scenario, requests=200, concurrency=4, warmup=10, seed=0, asgi=False):
+    """
+    Drive one scenario through the test client from ``concurrency`` threads,
+    or with ``asgi`` through the async test client (the ASGI handler) from
+    ``concurrency`` tasks on one event loop.
+    """
+    user_ids = list(User.objects.values_list("user_id", flat=True))
+    post_ids = list(Post.objects.values_list("post_id", flat=True))
+    if not user_ids or not post_ids:
+        raise ValueError("The database has no users or posts, run generate_dataset first")
+    page_count = max(1, -(-len(post_ids) // 5))
+
+    per_worker = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    if warmup:
+        if asgi:
+            asyncio.run(_run_async_workers(scenario, [warmup], user_ids, post_ids, page_count, seed))
+        else:
+            _worker(scenario, warmup, user_ids, post_ids, page_count, seed)
+
+    # Async views run their queries in other threads than the client, so
+    # they are counted by the request metrics (see mainapp.metrics).
+    requests_before, queries_before = metrics.registry.totals()
+    started = time.perf_counter()
+    if asgi:
+        results = asyncio.run(_run_async_workers(scenario, per_worker, user_ids, post_ids, page_count, seed))
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(
+                _worker,
+                itertools.repeat(scenario), per_worker, itertools.repeat(user_ids),
+                itertools.repeat(post_ids), itertools.repeat(page_count),
+                [seed + i + 1 for i in range(concurrency)],
+            ))
+    elapsed = time.perf_counter() - started
+    requests_after, queries_after = metrics.registry.totals()
+    queries = queries_after - queries_before if requests_after > requests_before else None
+
+    latencies = sorted(itertools.chain.from_iterable(r[0] for r in results))
+    done = len(latencies)
+    return {
+        "requests": done,
+        "errors": sum(r[1] for r in results),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "throughput_rps": round(done / elapsed, 1),
+        "queries_per_request": round(queries / done, 2) if queries is not None else None,
+    }
+
+
+def run_benchmark(scenarios=None, requests=200, concurrency=4, warmup=10, seed=0, asgi=False):
+    """
+    Run the named scenarios (all of SCENARIOS by default) one after the
+    other against the configured database and return the report.
+    toggle_like writes to the database.
+    """
+    names = scenarios or list(SCENARIOS)
+    report = {
+        "revision": _git_revision(),
+        "database": settings.DATABASES["default"]["ENGINE"],
+        "requests": requests,
+        "concurrency": concurrency,
+        "handler": "asgi" if asgi else "wsgi",
+        "seed": seed,
+        "posts": Post.objects.count(),
+        "users": User.objects.count(),
+        "scenarios": dict(),
+    }
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+        for name in names:
+            report["scenarios"][name] = run_scenario(
+                SCENARIOS[name], requests=requests, concurrency=concurrency, warmup=warmup, seed=seed, asgi=asgi,
+            )
+    return report
+
+
+Like = Post.liker_id.through
+
+
+def _sqlite_aliases(mode, path):
+    """(write alias, read alias) settings for one bench_sqlite mode on ``path``."""
+    if mode == "stock":
+        primary = {"ENGINE": "django.db.backends.sqlite3", "NAME": path}
+        return primary, primary
+
+    primary = copy.deepcopy(settings.DATABASES[DEFAULT_DB_ALIAS])
+    primary["NAME"] = path
+    replica = copy.deepcopy(settings.DATABASES.get("replica", primary))
+    replica["NAME"] = f"file:{path}?mode=ro" if "replica" in settings.DATABASES else path
+    replica.pop("TEST", None)
+    return primary, replica
+
+
+def _register(aliases):
+    configured = connections.configure_settings({DEFAULT_DB_ALIAS: settings.DATABASES[DEFAULT_DB_ALIAS], **aliases})
+    for alias in aliases:
+        connections.settings[alias] = configured[alias]
+
+
+def _unregister(aliases):
+    for alias in aliases:
+        connections.settings.pop(alias, None)
+
+
+def _reader(alias, post_count, deadline, seed):
+    rng = random.Random(seed)
+    latencies = list()
+    errors = 0
+    try:
+        while time.perf_counter() < deadline:
+            offset = rng.randrange(max(1, post_count - 5))
+            started = time.perf_counter()
+            try:
+                posts = Post.objects.using(alias).order_by("-created_at", "-post_id")[offset:offset + 5]
+                post_ids = [post.post_id for post in posts]
+                Post.objects.using(alias).count()
+                list(Like.objects.using(alias).filter(post_id__in=post_ids).values_list("post_id", "user_id"))
+            except OperationalError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+            # End of a "request": stock settings reconnect every time.
+            connections[alias].close_if_unusable_or_obsolete()
+    finally:
+        connections[alias].close()
+    return latencies, errors
+
+
+def _writer(alias, post_ids, user_ids, deadline, seed):
+    rng = random.Random(seed)
+    latencies = list()
+    errors = 0
+    try:
+        while time.perf_counter() < deadline:
+            post_id, user_id = rng.choice(post_ids), rng.choice(user_ids)
+            started = time.perf_counter()
+            try:
+                with transaction.atomic(using=alias):
+                    deleted, _ = Like.objects.using(alias).filter(post_id=post_id, user_id=user_id).delete()
+                    if not deleted:
+                        Like.objects.using(alias).create(post_id=post_id, user_id=user_id)
+                    Post.objects.using(alias).filter(pk=post_id).adjust_counts(likes=-1 if deleted else 1)
+            except (OperationalError, IntegrityError):
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+            connections[alias].close_if_unusable_or_obsolete()
+    finally:
+        connections[alias].close()
+    return latencies, errors
+
+
+def _summary(results, elapsed):
+    latencies = sorted(itertools.chain.from_iterable(r[0] for r in results))
+    if not latencies:
+        return {"operations": 0, "errors": 0}
+    return {
+        "operations": len(latencies),
+        "errors": sum(r[1] for r in results),
+        "throughput_ops": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def bench_sqlite(readers=4, writers=2, duration=5.0, seed=0):
+    """
+    Concurrent read/write throughput of the configured SQLite database under
+    stock settings and under the production ones (SQLITE_PRODUCTION), each
+    run on its own copy of the database. Readers load a dashboard page,
+    writers toggle likes; every operation ends like a request does, so the
+    stock run also pays for reconnecting.
+    """
+    source = settings.DATABASES[DEFAULT_DB_ALIAS]
+    if source["ENGINE"] != "django.db.backends.sqlite3":
+        raise ValueError("bench_sqlite needs a SQLite default database")
+    post_ids = list(Post.objects.values_list("post_id", flat=True))
+    user_ids = list(User.objects.values_list("user_id", flat=True))
+    if not post_ids or not user_ids:
+        raise ValueError("The database has no users or posts, run generate_dataset first")
+
+    report = {
+        "revision": _git_revision(),
+        "readers": readers,
+        "writers": writers,
+        "duration": duration,
+        "posts": len(post_ids),
+        "modes": dict(),
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ("stock", "production"):
+            path = os.path.join(directory, f"{mode}.sqlite3")
+            src, dst = sqlite3.connect(source["NAME"]), sqlite3.connect(path)
+            try:
+                src.backup(dst)
+                dst.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                src.close()
+                dst.close()
+
+            primary, replica = _sqlite_aliases(mode, path)
+            aliases = {f"bench_{mode}": primary, f"bench_{mode}_read": replica}
+            write_alias, read_alias = aliases
+            _register(aliases)
+            try:
+                # Let the production pragmas (WAL) take effect before timing.
+                connections[write_alias].ensure_connection()
+                connections[write_alias].close()
+
+                deadline = time.perf_counter() + duration
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=readers + writers) as pool:
+                    read_futures = [
+                        pool.submit(_reader, read_alias, len(post_ids), deadline, seed + i)
+                        for i in range(readers)
+                    ]
+                    write_futures = [
+                        pool.submit(_writer, write_alias, post_ids, user_ids, deadline, seed + readers + i)
+                        for i in range(writers)
+                    ]
+                    read_results = [f.result() for f in read_futures]
+                    write_results = [f.result() for f in write_futures]
+                elapsed = time.perf_counter() - started
+            finally:
+                for alias in aliases:
+                    connections[alias].close()
+                _unregister(aliases)
+
+            report["modes"][mode] = {
+                "reads": _summary(read_results, elapsed),
+                "writes": _summary(write_results, elapsed),
+            }
+
+    stock, production = report["modes"]["stock"], report["modes"]["production"]
+    report["speedup"] = {
+        kind: round(production[kind]["throughput_ops"] / stock[kind]["throughput_ops"], 2)
+        for kind in ("reads", "writes")
+        if stock[kind].get("throughput_ops") and production[kind].get("throughput_ops")
+    }
+    return report
@@ -0,0 +1,58 @@
+import secrets
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def acondition(validators):
+    """
+    django.views.decorators.http.condition() for async views.
+
+    condition() calls its etag and last-modified functions synchronously,
+    where the async ORM can't be awaited, so here ``validators`` is a
+    coroutine function taking the view's arguments and returning
+    ``(etag, last_modified)``, either of which may be None.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            etag, last_modified = await validators(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag is not None else None
+            last_modified = int(last_modified.timestamp()) if last_modified else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+
+            if request.method in ("GET", "HEAD"):
+                if last_modified and not response.has_header("Last-Modified"):
+                    response.headers["Last-Modified"] = http_date(last_modified)
+                if etag:
+                    response.headers.setdefault("ETag", etag)
+            return response
+        return inner
+    return decorator
+
+
+def staff_or_token(setting):
+    """
+    Limits a view to staff users and to clients sending ``Authorization:
+    Bearer <token>`` with the token named by ``setting``. With no token
+    configured only staff get in.
+    """
+    def decorator(view):
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            token = getattr(settings, setting, None)
+            authorization = request.headers.get("Authorization", "")
+            if not (
+                (request.user.is_authenticated and request.user.is_staff)
+                or (token and secrets.compare_digest(authorization, f"Bearer {token}"))
+            ):
+                return JsonResponse({'error': 'Staff or token only'}, status=403)
+            return view(request, *args, **kwargs)
+        return inner
+    return decorator
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+from .models import Post
+
+
+class Subscription:
+    """
+    One SSE client's view of the hub. Lives on the client's event loop and
+    keeps only the latest counts per post until the client reads them, so a
+    slow client can't make it grow past the posts it subscribed to.
+    """
+
+    def __init__(self, post_ids, loop):
+        self.post_ids = frozenset(post_ids)
+        self.loop = loop
+        self._events = dict()
+        self._ready = asyncio.Event()
+
+    def _deliver(self, events):
+        # Runs on self.loop.
+        for event in events:
+            self._events.setdefault(event["post_id"], {}).update(event)
+        self._ready.set()
+
+    async def get(self, timeout):
+        """The pending events, or an empty list after ``timeout`` seconds."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._ready.clear()
+        events, self._events = list(self._events.values()), dict()
+        return events
+
+
+class Hub:
+    """
+    In-process pub/sub of like and repost counts.
+
+    publish() can be called from any thread. Changes are merged per post
+    and sent to the subscribers of that post at most once per ``window``
+    seconds, so a post liked hundreds of times a second still produces a
+    few events. Only subscribers in the same process see the events.
+    """
+
+    def __init__(self, window=0.25):
+        self.window = window
+        self._subscribers = defaultdict(set)
+        self._pending = dict()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def subscribe(self, post_ids):
+        subscription = Subscription(post_ids, asyncio.get_running_loop())
+        with self._lock:
+            for post_id in subscription.post_ids:
+                self._subscribers[post_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for post_id in subscription.post_ids:
+                subscribers = self._subscribers.get(post_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[post_id]
+
+    def has_subscribers(self, post_id):
+        return post_id in self._subscribers
+
+    def publish(self, post_id, **counts):
+        with self._lock:
+            if post_id not in self._subscribers:
+                return
+            self._pending.setdefault(post_id, {"post_id": post_id}).update(counts)
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, dict()
+            self._timer = None
+            batches = defaultdict(list)
+            for post_id, event in pending.items():
+                for subscription in self._subscribers.get(post_id, ()):
+                    batches[subscription].append(event)
+
+        for subscription, events in batches.items():
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, events)
+            except RuntimeError:
+                # The loop closed under a client that never unsubscribed.
+                self.unsubscribe(subscription)
+
+
+hub = Hub(window=getattr(settings, "EVENTS_COALESCE_WINDOW", 0.25))
+
+
+def format_event(data, event="counts"):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def publish_counts(post_id):
+    """Publish the stored counts of a post, if anyone is listening for it."""
+    if not hub.has_subscribers(post_id):
+        return
+    counts = Post.objects.filter(pk=post_id).values("like_count", "repost_count").first()
+    if counts is not None:
+        hub.publish(post_id, **counts)
+
+
+def snapshot(post_ids):
+    return Post.objects.filter(post_id__in=post_ids).values("post_id", "like_count", "repost_count")
+
+
+async def stream(post_ids, keepalive=15):
+    """
+    The text/event-stream body for ``post_ids``: their current counts, then
+    every change as it is published. Subscribing before reading the counts
+    means a change made in between is sent rather than lost. The generator
+    only holds a coroutine while it waits, not a thread.
+    """
+    subscription = hub.subscribe(post_ids)
+    try:
+        async for counts in snapshot(post_ids):
+            yield format_event(counts)
+        while True:
+            events = await subscription.get(keepalive)
+            if not events:
+                yield ": keepalive\n\n"
+            for event in events:
+                yield format_event(event)
+    finally:
+        hub.unsubscribe(subscription)
@@ -0,0 +1,76 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Post
+
+EXPORT_FIELDS = [
+    "post_id", "post_content", "loc_lon", "loc_lat", "loc_name",
+    "created_at", "post_status", "poster_id", "repost_id",
+]
+
+
+def export_posts(since_id=None, since=None, chunk_size=1000, all_posts=False):
+    """
+    Yield every active post (every post with ``all_posts``) as one NDJSON
+    line, oldest first.
+
+    Rows are read with a chunked iterator and the likers of each chunk are
+    fetched in a single query, so memory use is bounded by ``chunk_size``
+    no matter how large the table is.
+    """
+    chunk = list()
+    for row in _export_rows(since_id, since, all_posts).iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield from _export_chunk(chunk, _liker_links(chunk))
+            chunk = list()
+    if chunk:
+        yield from _export_chunk(chunk, _liker_links(chunk))
+
+
+async def aexport_posts(since_id=None, since=None, chunk_size=1000, all_posts=False):
+    """
+    export_posts() through the async ORM, for streaming responses under
+    ASGI. Chunks are read by post_id, each with one awaited query.
+    """
+    posts = _export_rows(None, since, all_posts)
+    last_id = since_id
+    while True:
+        chunk = posts if last_id is None else posts.filter(post_id__gt=last_id)
+        chunk = [row async for row in chunk[:chunk_size]]
+        if not chunk:
+            break
+        links = [link async for link in _liker_links(chunk)]
+        for line in _export_chunk(chunk, links):
+            yield line
+        if len(chunk) < chunk_size:
+            break
+        last_id = chunk[-1][0]
+
+
+def _export_rows(since_id, since, all_posts):
+    posts = Post.objects.all() if all_posts else Post.objects.active()
+    posts = posts.order_by("post_id").values_list(*EXPORT_FIELDS)
+    if since_id is not None:
+        posts = posts.filter(post_id__gt=since_id)
+    if since is not None:
+        posts = posts.filter(created_at__gte=since)
+    return posts
+
+
+def _liker_links(rows):
+    return Post.liker_id.through.objects.filter(
+        post_id__in=[row[0] for row in rows]
+    ).values_list("post_id", "user_id")
+
+
+def _export_chunk(rows, links):
+    likers = {row[0]: [] for row in rows}
+    for post_id, user_id in links:
+        likers[post_id].append(user_id)
+
+    for row in rows:
+        data = dict(zip(EXPORT_FIELDS, row))
+        data["liker_id"] = likers[data["post_id"]]
+        yield json.dumps(data, cls=DjangoJSONEncoder) + "\n"
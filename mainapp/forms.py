@@ -1,5 +1,6 @@
 import re
 from django import forms
+from django.contrib.auth.hashers import identify_hasher
 
 from .models import User, Post
 
@@ -42,11 +43,14 @@ class UserForm(forms.ModelForm):
             raise forms.ValidationError("Username must be atleast 3 characters long")
         elif not re.match(r'^[a-zA-Z0-9._-]{3,32}$', username):
             raise forms.ValidationError("Please use acceptable character (A-Za-z0-9_-.)")
-        elif User.objects.filter(username=username).exists():
+        elif self.username_taken(username):
             raise forms.ValidationError(f'Sorry, "{username}" already taken. Please try another one')
         
         return username
     
+    def username_taken(self, username):
+        return User.objects.filter(username=username).exists()
+    
     def clean_email(self):
         email = self.cleaned_data.get("email")
         
@@ -70,6 +74,39 @@ class UserForm(forms.ModelForm):
                 "Password and Confirm Password does not match"
             )
 
+class BulkUserForm(UserForm):
+    # For ingest batches: usernames are checked against a set loaded once
+    # for the whole batch, and an existing password hash can be imported
+    # instead of a raw password.
+    password_hash = forms.CharField(required=False)
+    
+    def __init__(self, *args, taken_usernames=frozenset(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.taken_usernames = taken_usernames
+        self.fields["password"].required = False
+        self.fields["confirmed_password"].required = False
+    
+    def username_taken(self, username):
+        return username in self.taken_usernames
+    
+    def validate_unique(self):
+        pass
+    
+    def clean_password_hash(self):
+        password_hash = self.cleaned_data.get("password_hash")
+        if password_hash:
+            try:
+                identify_hasher(password_hash)
+            except ValueError:
+                raise forms.ValidationError("Unknown password hash format")
+        return password_hash
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get("password") and not cleaned_data.get("password_hash"):
+            self.add_error("password", "Password is required")
+        return cleaned_data
+
 class LoginForm(forms.Form):
     username = forms.CharField(label="Username")
     password = forms.CharField(widget=forms.PasswordInput, label="Password")
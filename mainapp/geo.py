@@ -0,0 +1,150 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def to_unit_vector(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    return (
+        math.cos(lat) * math.cos(lon),
+        math.cos(lat) * math.sin(lon),
+        math.sin(lat),
+    )
+
+
+class KDTree:
+    """
+    Static 3-d tree for nearest-neighbour lookups.
+
+    Points are expected on the unit sphere (see ``to_unit_vector``), where
+    the straight-line distance grows with the great-circle distance, so the
+    nearest point is also the geographically closest one, dateline and poles
+    included.
+    """
+
+    def __init__(self, points):
+        self.points = points
+        self.root = self._build(list(range(len(points))), 0)
+
+    def _build(self, indexes, depth):
+        if not indexes:
+            return None
+        axis = depth % 3
+        indexes.sort(key=lambda i: self.points[i][axis])
+        mid = len(indexes) // 2
+        return (
+            indexes[mid],
+            axis,
+            self._build(indexes[:mid], depth + 1),
+            self._build(indexes[mid + 1:], depth + 1),
+        )
+
+    def nearest(self, target):
+        best, best_dist = None, math.inf
+        stack = [(self.root, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if node is None or bound >= best_dist:
+                continue
+            index, axis, left, right = node
+            point = self.points[index]
+            dist = sum((a - b) ** 2 for a, b in zip(point, target))
+            if dist < best_dist:
+                best, best_dist = index, dist
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # The far side is only worth visiting if the splitting plane is
+            # closer than the best match so far.
+            stack.append((far, diff * diff))
+            stack.append((near, 0.0))
+        return best
+
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def encode_geohash(lat, lon, precision=GEOHASH_PRECISION):
+    bits = 5 * precision
+    lon_bits, lat_bits = (bits + 1) // 2, bits // 2
+    # Which of the 2**n equal slices each coordinate falls in, i.e. the
+    # result of n bisection steps, computed in one go.
+    lat_cell = min(int((lat + 90) / 180 * (1 << lat_bits)), (1 << lat_bits) - 1)
+    lon_cell = min(int((lon + 180) / 360 * (1 << lon_bits)), (1 << lon_bits) - 1)
+
+    # Interleave the bits, longitude first, then read them 5 at a time.
+    code = 0
+    for k in range(bits):
+        if k % 2 == 0:
+            code = (code << 1) | ((lon_cell >> (lon_bits - 1 - k // 2)) & 1)
+        else:
+            code = (code << 1) | ((lat_cell >> (lat_bits - 1 - k // 2)) & 1)
+    return "".join(
+        GEOHASH_ALPHABET[(code >> shift) & 31]
+        for shift in range(bits - 5, -1, -5)
+    )
+
+
+def geohash_cell_size(precision):
+    """(lat degrees, lon degrees) covered by one geohash cell."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180 / 2 ** lat_bits, 360 / 2 ** lon_bits
+
+
+def bounding_box(lat, lon, radius_km):
+    """
+    Lat range and list of lon ranges that contain every point within
+    ``radius_km``. Boxes crossing the antimeridian are split in two.
+    """
+    dlat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat < 1e-9 or dlat / cos_lat >= 180:
+        return (min_lat, max_lat), [(-180.0, 180.0)]
+
+    dlon = dlat / cos_lat
+    min_lon, max_lon = lon - dlon, lon + dlon
+    if min_lon < -180:
+        return (min_lat, max_lat), [(min_lon + 360, 180.0), (-180.0, max_lon)]
+    if max_lon > 180:
+        return (min_lat, max_lat), [(min_lon, 180.0), (-180.0, max_lon - 360)]
+    return (min_lat, max_lat), [(min_lon, max_lon)]
+
+
+def covering_geohashes(lat_range, lon_ranges, max_cells=32):
+    """
+    Geohash prefixes whose cells together cover the box, using the finest
+    precision that needs at most ``max_cells`` of them.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        cell_lat, cell_lon = geohash_cell_size(precision)
+        lat_steps = _cell_span(lat_range, -90, cell_lat, 180)
+        lon_steps = [_cell_span(r, -180, cell_lon, 360) for r in lon_ranges]
+        if len(lat_steps) * sum(len(s) for s in lon_steps) <= max_cells:
+            break
+
+    cells = set()
+    for i in lat_steps:
+        for steps in lon_steps:
+            for j in steps:
+                center_lat = -90 + (i + 0.5) * cell_lat
+                center_lon = -180 + (j + 0.5) * cell_lon
+                cells.add(encode_geohash(center_lat, center_lon, precision))
+    return sorted(cells)
+
+
+def _cell_span(value_range, origin, size, extent):
+    first = int((value_range[0] - origin) // size)
+    last = int((value_range[1] - origin) // size) + 1
+    return range(first, min(last, round(extent / size)))
@@ -0,0 +1,94 @@
+import csv
+import logging
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+
+from .geo import KDTree, haversine_km, to_unit_vector
+
+logger = logging.getLogger(__name__)
+
+
+class Gazetteer:
+    """
+    Nearest-city lookup over a local city list.
+
+    Reads either a GeoNames dump (``cities500.txt``/``cities15000.txt``,
+    tab separated, no header) or a CSV file with ``name``, ``country``,
+    ``lat`` and ``lon`` columns.
+    """
+
+    def __init__(self, places):
+        self.places = places
+        self.tree = KDTree([to_unit_vector(lat, lon) for _, lat, lon in places])
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, newline="", encoding="utf-8") as f:
+            first = f.readline()
+            f.seek(0)
+            if "\t" in first:
+                places = [
+                    (f"{row[1]}, {row[8]}", float(row[4]), float(row[5]))
+                    for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
+                    if len(row) > 8
+                ]
+            else:
+                places = list()
+                for row in csv.DictReader(f):
+                    name = row["name"]
+                    if row.get("country"):
+                        name = f"{name}, {row['country']}"
+                    lat = row.get("lat", row.get("latitude"))
+                    lon = row.get("lon", row.get("longitude"))
+                    places.append((name, float(lat), float(lon)))
+        return cls(places)
+
+    def nearest(self, lat, lon):
+        if not self.places:
+            return None, None
+        name, place_lat, place_lon = self.places[self.tree.nearest(to_unit_vector(lat, lon))]
+        return name, haversine_km(lat, lon, place_lat, place_lon)
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+def get_gazetteer():
+    global _gazetteer
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            path = getattr(settings, "GEOCODER_GAZETTEER", None)
+            try:
+                _gazetteer = Gazetteer.from_file(path) if path else Gazetteer([])
+            except OSError:
+                logger.warning("Gazetteer %s could not be read, reverse geocoding is disabled", path)
+                _gazetteer = Gazetteer([])
+    return _gazetteer
+
+
+def load_gazetteer(path):
+    global _gazetteer
+    gazetteer = Gazetteer.from_file(path)
+    with _gazetteer_lock:
+        _gazetteer = gazetteer
+        _lookup.cache_clear()
+    return gazetteer
+
+
+@lru_cache(maxsize=8192)
+def _lookup(lat, lon):
+    name, distance = get_gazetteer().nearest(lat, lon)
+    if name is None or distance > getattr(settings, "GEOCODER_MAX_DISTANCE_KM", 100):
+        return ""
+    return name
+
+
+def reverse_geocode(lat, lon):
+    """Name of the closest known city to a coordinate, or "" if there is none."""
+    if lat is None or lon is None:
+        return ""
+    # Two decimals is roughly 1 km, well below the spacing of the cities
+    # themselves, and lets nearby posts share cache entries.
+    return _lookup(round(lat, 2), round(lon, 2))
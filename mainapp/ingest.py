@@ -0,0 +1,264 @@
+import time
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from . import threads
+from .forms import BulkUserForm, PostForm
+from .geocoding import reverse_geocode
+from .likes import existing_links
+from .pagination import adjust_timeline_count
+from .models import Post, Status, User
+
+Like = Post.liker_id.through
+
+
+class IngestError(Exception):
+    def __init__(self, errors):
+        super().__init__("Invalid ingest batch")
+        self.errors = errors
+
+
+def ingest(batch, chunk_size=1000):
+    """
+    Validate and write a batch of users, posts and likes.
+
+    ``batch`` looks like::
+
+        {
+            "users": [{"username", "email", "display_name", "password" or "password_hash"}],
+            "posts": [{"ref", "poster", "post_content", "loc_lat", "loc_lon",
+                       "repost_id" or "repost_ref"}],
+            "likes": [{"user", "post_id" or "post_ref"}],
+        }
+
+    ``poster`` and ``user`` are usernames, either existing or from the same
+    batch. ``ref`` is a client-side name for a new post that later posts and
+    likes of the batch can point at. Every row is validated with the rules of
+    UserForm/PostForm before anything is written; if any row is invalid,
+    IngestError lists the problems and nothing is saved. Rows are then
+    written with bulk_create, one transaction per chunk.
+    """
+    started = time.perf_counter()
+    if not isinstance(batch, dict):
+        raise IngestError([{"batch": "Expected an object with users, posts and likes lists"}])
+    users = batch.get("users", [])
+    posts = batch.get("posts", [])
+    likes = batch.get("likes", [])
+    for name, rows in (("users", users), ("posts", posts), ("likes", likes)):
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise IngestError([{"batch": f"{name} must be a list of objects"}])
+    errors = _check_references(posts, likes)
+    if errors:
+        raise IngestError(errors)
+
+    new_users = _validate_users(users, errors)
+    user_ids = _resolve_users(
+        {row.get("poster") for row in posts} | {row.get("user") for row in likes},
+        new_users,
+    )
+    new_posts = _validate_posts(posts, user_ids, errors)
+    new_likes = _validate_likes(likes, user_ids, new_posts, errors)
+    if errors:
+        raise IngestError(errors)
+
+    for i in range(0, len(new_users), chunk_size):
+        with transaction.atomic():
+            User.objects.bulk_create(new_users[i:i + chunk_size])
+    user_ids.update(
+        User.objects.filter(username__in=[u.username for u in new_users]).values_list("username", "user_id")
+    )
+
+    post_ids = _write_posts(new_posts, user_ids, chunk_size)
+    _write_likes(new_likes, user_ids, post_ids, chunk_size)
+
+    elapsed = time.perf_counter() - started
+    rows = len(new_users) + len(new_posts) + len(new_likes)
+    return {
+        "users": len(new_users),
+        "posts": len(new_posts),
+        "likes": len(new_likes),
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed else None,
+    }
+
+
+REFERENCE_FIELDS = {
+    "posts": {"ref": (str, int), "repost_ref": (str, int), "poster": str, "repost_id": int},
+    "likes": {"post_ref": (str, int), "user": str, "post_id": int},
+}
+
+def _check_references(posts, likes):
+    errors = list()
+    for name, rows in (("posts", posts), ("likes", likes)):
+        for i, row in enumerate(rows):
+            row_errors = {
+                field: ["Wrong type"]
+                for field, types in REFERENCE_FIELDS[name].items()
+                if row.get(field) is not None
+                and (not isinstance(row[field], types) or isinstance(row[field], bool))
+            }
+            if row_errors:
+                errors.append({name: i, "errors": row_errors})
+    return errors
+
+
+def _validate_users(rows, errors):
+    usernames = [row.get("username") for row in rows]
+    taken = set(User.objects.filter(username__in=usernames).values_list("username", flat=True))
+
+    new_users = list()
+    for i, row in enumerate(rows):
+        data = dict(row)
+        data.setdefault("confirmed_password", data.get("password"))
+        form = BulkUserForm(data, taken_usernames=taken)
+        if not form.is_valid():
+            errors.append({"users": i, "errors": dict(form.errors)})
+            continue
+        taken.add(form.cleaned_data["username"])
+
+        user = form.save(commit=False)
+        if form.cleaned_data["password_hash"]:
+            user.password = form.cleaned_data["password_hash"]
+        else:
+            user.set_password(form.cleaned_data["password"])
+        user.activate()
+        new_users.append(user)
+    return new_users
+
+
+def _resolve_users(usernames, new_users):
+    user_ids = dict(
+        User.objects.filter(username__in=[u for u in usernames if u]).values_list("username", "user_id")
+    )
+    # New users get their ids once written; None marks them as known.
+    for user in new_users:
+        user_ids.setdefault(user.username, None)
+    return user_ids
+
+
+def _validate_posts(rows, user_ids, errors):
+    repost_ids = {row["repost_id"] for row in rows if row.get("repost_id") is not None}
+    existing = set(Post.objects.filter(post_id__in=repost_ids).values_list("post_id", flat=True))
+
+    refs = set()
+    new_posts = list()
+    for i, row in enumerate(rows):
+        form = PostForm({
+            "post_content": row.get("post_content"),
+            "loc_lat": row.get("loc_lat"),
+            "loc_lon": row.get("loc_lon"),
+        })
+        row_errors = dict(form.errors) if not form.is_valid() else {}
+        if row.get("poster") not in user_ids:
+            row_errors["poster"] = ["Unknown user"]
+        if row.get("repost_id") is not None and row["repost_id"] not in existing:
+            row_errors["repost_id"] = ["Unknown post"]
+        if row.get("repost_ref") is not None and row["repost_ref"] not in refs:
+            row_errors["repost_ref"] = ["Must name a post earlier in the batch"]
+        if row.get("ref") is not None:
+            if row["ref"] in refs:
+                row_errors["ref"] = ["Duplicate ref"]
+            refs.add(row["ref"])
+        if row_errors:
+            errors.append({"posts": i, "errors": row_errors})
+            continue
+
+        post = form.instance
+        post.post_status = Status.ACTIVE
+        post.loc_geohash = post.compute_geohash()
+        post.loc_name = reverse_geocode(post.loc_lat, post.loc_lon)
+        post.repost_id_id = row.get("repost_id")
+        new_posts.append((row, post))
+    return new_posts
+
+
+def _validate_likes(rows, user_ids, new_posts, errors):
+    refs = {row.get("ref") for row, _ in new_posts if row.get("ref") is not None}
+    post_ids = {row["post_id"] for row in rows if row.get("post_id") is not None}
+    existing = set(Post.objects.filter(post_id__in=post_ids).values_list("post_id", flat=True))
+
+    new_likes = list()
+    for i, row in enumerate(rows):
+        row_errors = {}
+        if row.get("user") not in user_ids:
+            row_errors["user"] = ["Unknown user"]
+        if row.get("post_ref") is not None:
+            if row["post_ref"] not in refs:
+                row_errors["post_ref"] = ["Unknown ref"]
+        elif row.get("post_id") not in existing:
+            row_errors["post_id"] = ["Unknown post"]
+        if row_errors:
+            errors.append({"likes": i, "errors": row_errors})
+            continue
+        new_likes.append(row)
+    return new_likes
+
+
+def _write_posts(new_posts, user_ids, chunk_size):
+    ref_ids = dict()
+    reposted = Counter()
+    chunk = list()
+
+    def flush():
+        with transaction.atomic():
+            Post.objects.bulk_create([post for _, post in chunk])
+        for row, post in chunk:
+            if row.get("ref") is not None:
+                ref_ids[row["ref"]] = post.post_id
+            if post.repost_id_id:
+                reposted[post.repost_id_id] += 1
+        chunk.clear()
+
+    for row, post in new_posts:
+        post.poster_id_id = user_ids[row["poster"]]
+        if row.get("repost_ref") is not None:
+            # The target must have its id before this post can point at it.
+            if row["repost_ref"] not in ref_ids:
+                flush()
+            post.repost_id_id = ref_ids[row["repost_ref"]]
+        chunk.append((row, post))
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    # bulk_create skips the post_save signal that maintains repost_count.
+    by_count = defaultdict(list)
+    for post_id, count in reposted.items():
+        by_count[count].append(post_id)
+    with transaction.atomic():
+        for count, post_ids in by_count.items():
+            Post.objects.filter(pk__in=post_ids).adjust_counts(reposts=count)
+    if reposted:
+        # Once for the whole batch, after it is committed.
+        post_ids = list(reposted)
+        transaction.on_commit(lambda: threads.invalidate_threads(post_ids))
+    if new_posts:
+        adjust_timeline_count(len(new_posts))
+
+    return ref_ids
+
+
+def _write_likes(new_likes, user_ids, ref_ids, chunk_size):
+    links = list({
+        (ref_ids[row["post_ref"]] if row.get("post_ref") is not None else row["post_id"], user_ids[row["user"]])
+        for row in new_likes
+    })
+
+    for i in range(0, len(links), chunk_size):
+        chunk = links[i:i + chunk_size]
+        with transaction.atomic():
+            # Some links may already exist; only the new ones are counted,
+            # so adjust_counts() can bump the trending scores by them too.
+            existing = existing_links(chunk)
+            added = [link for link in chunk if link not in existing]
+            Like.objects.bulk_create(
+                [Like(post_id=post_id, user_id=user_id) for post_id, user_id in added],
+                ignore_conflicts=True,
+            )
+            by_count = defaultdict(list)
+            for post_id, count in Counter(post_id for post_id, _ in added).items():
+                by_count[count].append(post_id)
+            for count, post_ids in by_count.items():
+                Post.objects.filter(pk__in=post_ids).adjust_counts(likes=count)
@@ -0,0 +1,301 @@
+import atexit
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+
+from .models import Post
+
+Like = Post.liker_id.through
+
+
+class LikeBuffer:
+    """
+    Write-behind buffer for like toggles.
+
+    Pending intents are kept per (post_id, user_id) as ``(was_liked, liked)``
+    so repeated toggles by the same user collapse into one row change (or
+    into nothing when they cancel out). They are written with one
+    bulk_create and a few bulk deletes once ``max_pending`` intents are
+    queued or ``flush_interval`` seconds have passed. Until a flush commits,
+    the intents it is writing still count as the current state, so a toggle
+    arriving meanwhile builds on them rather than on the database.
+
+    The buffer lives in the worker process, so the pending likes of other
+    workers only show up once those workers flush.
+    """
+
+    def __init__(self, max_pending=500, flush_interval=1.0):
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._pending = {}
+        # The intents flush() is writing, still the truth until they commit.
+        self._inflight = {}
+        self._flushes = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+    def _intent(self, key):
+        # Called with self._lock held.
+        intent = self._pending.get(key)
+        if intent is None and key in self._inflight:
+            liked = self._inflight[key][1]
+            intent = (liked, liked)
+        return intent
+
+    def toggle(self, post_id, user_id):
+        key = (post_id, user_id)
+        while True:
+            with self._lock:
+                intent = self._intent(key)
+                flushes = self._flushes
+            if intent is None:
+                was_liked = Like.objects.filter(post_id=post_id, user_id=user_id).exists()
+                intent = (was_liked, was_liked)
+
+            with self._lock:
+                if self._flushes != flushes:
+                    # A flush committed while we read; what we read may be stale.
+                    continue
+                # Another thread may have queued a toggle while we were reading.
+                was_liked, current = self._intent(key) or intent
+                liked = not current
+                if liked == was_liked:
+                    self._pending.pop(key, None)
+                else:
+                    self._pending[key] = (was_liked, liked)
+                full = len(self._pending) >= self.max_pending
+                if self._pending and self._timer is None:
+                    self._timer = threading.Timer(self.flush_interval, self._timed_flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+            break
+
+        if full:
+            self.flush()
+
+        return liked, self.like_counts([post_id])[post_id]
+
+    def pending_deltas(self, post_ids):
+        post_ids = set(post_ids)
+        deltas = defaultdict(int)
+        with self._lock:
+            for intents in (self._inflight, self._pending):
+                for (post_id, _), (was_liked, liked) in intents.items():
+                    if post_id in post_ids:
+                        deltas[post_id] += liked - was_liked
+        return deltas
+
+    def pending_likes(self, post_ids, user_id):
+        post_ids = set(post_ids)
+        with self._lock:
+            return {
+                post_id: liked
+                for intents in (self._inflight, self._pending)
+                for (post_id, pending_user), (_, liked) in intents.items()
+                if pending_user == user_id and post_id in post_ids
+            }
+
+    def like_counts(self, post_ids):
+        counts = dict(Post.objects.filter(pk__in=post_ids).values_list("post_id", "like_count"))
+        for post_id, delta in self.pending_deltas(counts).items():
+            counts[post_id] = max(counts[post_id] + delta, 0)
+        return counts
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._inflight = pending
+            if not pending:
+                return 0
+
+            try:
+                self._write(pending)
+            except Exception:
+                # Put the intents back, combined with any toggle queued since.
+                with self._lock:
+                    for key, (was_liked, liked) in pending.items():
+                        newer = self._pending.get(key)
+                        if newer is not None:
+                            liked = newer[1]
+                        if liked == was_liked:
+                            self._pending.pop(key, None)
+                        else:
+                            self._pending[key] = (was_liked, liked)
+                    self._inflight = {}
+                    self._flushes += 1
+                raise
+
+            with self._lock:
+                self._inflight = {}
+                self._flushes += 1
+
+        return len(pending)
+
+    def _write(self, pending):
+        likes, unlikes = list(), list()
+        for key, (_, liked) in pending.items():
+            (likes if liked else unlikes).append(key)
+
+        with transaction.atomic():
+            # The counters follow the rows that really change, so a like
+            # that is already there or an unlike of a missing row (written
+            # by another worker, say) leaves them alone.
+            existing = existing_links(likes)
+            added = [key for key in likes if key not in existing]
+            Like.objects.bulk_create(
+                [Like(post_id=post_id, user_id=user_id) for post_id, user_id in added],
+                batch_size=500, ignore_conflicts=True,
+            )
+            removed = existing_links(unlikes)
+            for condition in _link_conditions(removed):
+                Like.objects.filter(condition).delete()
+
+            deltas = defaultdict(int)
+            for post_id, _ in added:
+                deltas[post_id] += 1
+            for post_id, _ in removed:
+                deltas[post_id] -= 1
+            by_delta = defaultdict(list)
+            for post_id, delta in deltas.items():
+                if delta:
+                    by_delta[delta].append(post_id)
+            for delta, post_ids in by_delta.items():
+                Post.objects.filter(pk__in=post_ids).adjust_counts(likes=delta)
+
+    def _timed_flush(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            connection.close()
+
+
+def _link_conditions(keys):
+    """Q objects matching the (post_id, user_id) pairs, 100 posts at a time."""
+    by_post = defaultdict(list)
+    for post_id, user_id in keys:
+        by_post[post_id].append(user_id)
+    by_post = list(by_post.items())
+    for i in range(0, len(by_post), 100):
+        condition = Q()
+        for post_id, user_ids in by_post[i:i + 100]:
+            condition |= Q(post_id=post_id, user_id__in=user_ids)
+        yield condition
+
+
+def existing_links(keys):
+    """The (post_id, user_id) pairs of ``keys`` that are liked in the database."""
+    existing = set()
+    for condition in _link_conditions(keys):
+        existing.update(Like.objects.filter(condition).values_list("post_id", "user_id"))
+    return existing
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+def get_like_buffer():
+    """The process-wide LikeBuffer, or None when LIKE_BUFFER_ENABLED is off."""
+    global _buffer
+    if not getattr(settings, "LIKE_BUFFER_ENABLED", False):
+        return None
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = LikeBuffer(
+                max_pending=getattr(settings, "LIKE_BUFFER_MAX_PENDING", 500),
+                flush_interval=getattr(settings, "LIKE_BUFFER_FLUSH_INTERVAL", 1.0),
+            )
+            atexit.register(_buffer.flush)
+    return _buffer
+
+
+def merge_pending(posts, user):
+    """Overlay buffered likes on timeline posts so viewers see them immediately."""
+    buffer = get_like_buffer()
+    if buffer is None or not posts:
+        return posts
+    post_ids = [p.post_id for p in posts]
+    deltas = buffer.pending_deltas(post_ids)
+    liked = buffer.pending_likes(post_ids, user.pk) if user.is_authenticated else {}
+    for p in posts:
+        p.like_count = max(p.like_count + deltas.get(p.post_id, 0), 0)
+        p.viewer_has_liked = liked.get(p.post_id, p.viewer_has_liked)
+    return posts
+
+
+def toggle_like(post_id, user_id):
+    """
+    Flip the like of ``user_id`` on ``post_id`` and return
+    ``(liked, like_count)``.
+
+    Works on the liker_id join table directly: the (post, user) unique index
+    answers the existence check, and the counter is adjusted only when a row
+    was really inserted or deleted, so concurrent double clicks can't drift it.
+    """
+    buffer = get_like_buffer()
+    if buffer is not None:
+        return buffer.toggle(post_id, user_id)
+
+    with transaction.atomic():
+        deleted, _ = Like.objects.filter(post_id=post_id, user_id=user_id).delete()
+        if deleted:
+            Post.objects.filter(pk=post_id).adjust_counts(likes=-1)
+            liked = False
+        else:
+            try:
+                with transaction.atomic():
+                    Like.objects.create(post_id=post_id, user_id=user_id)
+            except IntegrityError:
+                # Lost a race with a concurrent like of the same post.
+                pass
+            else:
+                Post.objects.filter(pk=post_id).adjust_counts(likes=1)
+            liked = True
+
+        like_count = Post.objects.filter(pk=post_id).values_list("like_count", flat=True).get()
+
+    return liked, like_count
+
+
+def _like_state_rows(post_ids, user):
+    return (
+        Post.objects.filter(pk__in=post_ids)
+        .with_viewer_state(user)
+        .values_list("post_id", "viewer_has_liked", "like_count")
+    )
+
+
+def _merge_pending_states(states, user):
+    buffer = get_like_buffer()
+    if buffer is not None:
+        deltas = buffer.pending_deltas(states)
+        pending = buffer.pending_likes(states, user.pk) if user.is_authenticated else {}
+        for post_id, state in states.items():
+            state["total_likes"] = max(state["total_likes"] + deltas.get(post_id, 0), 0)
+            state["liked"] = pending.get(post_id, state["liked"])
+
+    return states
+
+
+def like_states(post_ids, user):
+    """Map each existing post id to its like state for ``user`` in one query."""
+    states = {
+        post_id: {"liked": liked, "total_likes": like_count}
+        for post_id, liked, like_count in _like_state_rows(post_ids, user)
+    }
+    return _merge_pending_states(states, user)
+
+
+async def alike_states(post_ids, user):
+    """Async version of like_states()."""
+    states = {
+        post_id: {"liked": liked, "total_likes": like_count}
+        async for post_id, liked, like_count in _like_state_rows(post_ids, user)
+    }
+    return _merge_pending_states(states, user)
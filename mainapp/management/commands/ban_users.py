@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mainapp.models import User
+from mainapp.moderation import ban_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Ban users and mark all of their posts and reposts BANNED, in short chunked "
+        "transactions. Safe to run again to finish an interrupted ban."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("usernames", nargs="+")
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument(
+            "--start-id", type=int, default=0,
+            help="Resume from this post_id.",
+        )
+
+    def handle(self, *args, **options):
+        users = dict(User.objects.filter(username__in=options["usernames"]).values_list("username", "user_id"))
+        unknown = sorted(set(options["usernames"]) - set(users))
+        if unknown:
+            raise CommandError(f"Unknown users: {', '.join(unknown)}")
+
+        def progress(last_id, banned):
+            self.stdout.write(f"Banned posts up to {last_id}, {banned} so far")
+
+        banned = ban_users(
+            users.values(),
+            chunk_size=options["chunk_size"],
+            start_id=options["start_id"],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Done, {len(users)} users and {banned} posts banned"))
@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mainapp.benchmark import bench_sqlite
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent read/write throughput of stock and production SQLite settings "
+        "on copies of the default database (see mainapp.benchmark.bench_sqlite)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument("--writers", type=int, default=2)
+        parser.add_argument("--duration", type=float, default=5.0, help="Seconds per mode.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Also write the report to this file.")
+
+    def handle(self, *args, **options):
+        if options["readers"] < 0 or options["writers"] < 0 or options["readers"] + options["writers"] < 1:
+            raise CommandError("Need at least one reader or writer")
+
+        try:
+            report = bench_sqlite(
+                readers=options["readers"],
+                writers=options["writers"],
+                duration=options["duration"],
+                seed=options["seed"],
+            )
+        except ValueError as e:
+            raise CommandError(e)
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
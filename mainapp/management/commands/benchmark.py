@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mainapp.benchmark import SCENARIOS, run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the main views through the test client and report latency percentiles, "
+        "throughput and queries per request as JSON. toggle_like writes to the database, "
+        "so run it against a generated dataset (see generate_dataset)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenarios", nargs="*", metavar="scenario", help=f"Any of {', '.join(SCENARIOS)}; all by default.")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per scenario.")
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--warmup", type=int, default=10)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--asgi", action="store_true",
+                            help="Go through the ASGI handler with concurrent tasks instead of WSGI threads.")
+        parser.add_argument("--output", help="Also write the report to this file.")
+
+    def handle(self, *args, **options):
+        unknown = set(options["scenarios"]) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be positive")
+
+        try:
+            report = run_benchmark(
+                scenarios=options["scenarios"],
+                requests=options["requests"],
+                concurrency=options["concurrency"],
+                warmup=options["warmup"],
+                seed=options["seed"],
+                asgi=options["asgi"],
+            )
+        except ValueError as e:
+            raise CommandError(e)
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from mainapp.trending import decay
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebase the trending scores on the current time and drop the ones that "
+        "decayed below TRENDING_MIN_SCORE. Run it periodically, e.g. hourly from cron."
+    )
+
+    def handle(self, *args, **options):
+        kept, deleted = decay()
+        self.stdout.write(self.style.SUCCESS(f"Done, {kept} scores kept, {deleted} dropped"))
@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from mainapp.export import export_posts
+
+
+class Command(BaseCommand):
+    help = "Write posts as NDJSON (one JSON object per line) for analytics jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="File to write to, defaults to stdout.")
+        parser.add_argument("--since-id", type=int, help="Only posts with a larger post_id.")
+        parser.add_argument("--since", help="Only posts created at or after this ISO 8601 datetime.")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--all", action="store_true", help="Include banned posts.")
+
+    def handle(self, *args, **options):
+        since = options["since"]
+        if since is not None:
+            since = parse_datetime(since)
+            if since is None:
+                raise CommandError("--since must be an ISO 8601 datetime")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        lines = export_posts(
+            since_id=options["since_id"],
+            since=since,
+            chunk_size=options["chunk_size"],
+            all_posts=options["all"],
+        )
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.writelines(lines)
+        else:
+            sys.stdout.writelines(lines)
@@ -0,0 +1,57 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mainapp.benchmark import generate_dataset
+from mainapp.ingest import IngestError, ingest
+
+
+class Command(BaseCommand):
+    help = "Generate a seeded synthetic dataset for benchmarking (see mainapp.benchmark.generate_dataset)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--posts", type=int, default=1000)
+        parser.add_argument("--likes", type=int, default=5000,
+                            help="Likes to draw; repeated (user, post) draws are dropped.")
+        parser.add_argument("--repost-ratio", type=float, default=0.2)
+        parser.add_argument("--geotagged", type=float, default=0.3)
+        parser.add_argument("--like-exponent", type=float, default=1.1)
+        parser.add_argument("--prefix", default="bench", help="Usernames are <prefix><n>.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--output", help="Write the batch to this file instead of the database.")
+
+    def handle(self, *args, **options):
+        for name in ("repost_ratio", "geotagged"):
+            if not 0 <= options[name] <= 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be between 0 and 1")
+
+        batch = generate_dataset(
+            users=options["users"],
+            posts=options["posts"],
+            likes=options["likes"],
+            repost_ratio=options["repost_ratio"],
+            geotagged=options["geotagged"],
+            like_exponent=options["like_exponent"],
+            prefix=options["prefix"],
+            seed=options["seed"],
+        )
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(batch, f)
+            self.stdout.write(self.style.SUCCESS(f"Wrote the batch to {options['output']}"))
+            return
+
+        try:
+            result = ingest(batch, chunk_size=options["chunk_size"])
+        except IngestError as e:
+            for error in e.errors[:10]:
+                self.stderr.write(json.dumps(error))
+            raise CommandError(f"{len(e.errors)} invalid rows, nothing was written (try another --prefix)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {result['users']} users, {result['posts']} posts and {result['likes']} likes "
+            f"in {result['seconds']}s ({result['rows_per_second']} rows/sec)"
+        ))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mainapp import geocoding
+from mainapp.models import Post
+
+
+class Command(BaseCommand):
+    help = "Fill Post.loc_name for geotagged posts from the offline gazetteer."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--gazetteer",
+            help="Gazetteer file to use instead of settings.GEOCODER_GAZETTEER.",
+        )
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Re-geocode posts that already have a place name.",
+        )
+
+    def handle(self, *args, **options):
+        if options["gazetteer"]:
+            try:
+                geocoding.load_gazetteer(options["gazetteer"])
+            except OSError as e:
+                raise CommandError(e)
+        if not geocoding.get_gazetteer().places:
+            raise CommandError("No gazetteer loaded, see settings.GEOCODER_GAZETTEER")
+
+        posts = Post.objects.filter(loc_lat__isnull=False, loc_lon__isnull=False).order_by("post_id")
+        if not options["all"]:
+            posts = posts.filter(loc_name="")
+
+        last_id = 0
+        updated = 0
+        while True:
+            chunk = list(
+                posts.filter(post_id__gt=last_id).only("post_id", "loc_lat", "loc_lon", "loc_name")[:options["chunk_size"]]
+            )
+            if not chunk:
+                break
+            for post in chunk:
+                post.loc_name = geocoding.reverse_geocode(post.loc_lat, post.loc_lon)
+            updated += Post.objects.bulk_update(chunk, ["loc_name"])
+            last_id = chunk[-1].post_id
+            self.stdout.write(f"Geocoded posts up to {last_id}, {updated} updated")
+
+        self.stdout.write(self.style.SUCCESS(f"Done, {updated} posts updated"))
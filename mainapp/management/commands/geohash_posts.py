@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from mainapp.models import Post
+
+
+class Command(BaseCommand):
+    help = "Fill Post.loc_geohash for geotagged posts saved before it existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Recompute posts that already have a geohash.",
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.filter(loc_lat__isnull=False, loc_lon__isnull=False).order_by("post_id")
+        if not options["all"]:
+            posts = posts.filter(loc_geohash="")
+
+        last_id = 0
+        updated = 0
+        while True:
+            chunk = list(
+                posts.filter(post_id__gt=last_id).only("post_id", "loc_lat", "loc_lon", "loc_geohash")[:options["chunk_size"]]
+            )
+            if not chunk:
+                break
+            for post in chunk:
+                post.loc_geohash = post.compute_geohash()
+            updated += Post.objects.bulk_update(chunk, ["loc_geohash"])
+            last_id = chunk[-1].post_id
+            self.stdout.write(f"Geohashed posts up to {last_id}, {updated} updated")
+
+        self.stdout.write(self.style.SUCCESS(f"Done, {updated} posts updated"))
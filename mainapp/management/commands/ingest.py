@@ -0,0 +1,36 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mainapp.ingest import IngestError, ingest
+
+
+class Command(BaseCommand):
+    help = "Bulk load users, posts and likes from a JSON batch file (see mainapp.ingest.ingest)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help='JSON batch file, or "-" for stdin.')
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            if options["file"] == "-":
+                batch = json.load(sys.stdin)
+            else:
+                with open(options["file"], encoding="utf-8") as f:
+                    batch = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+
+        try:
+            result = ingest(batch, chunk_size=options["chunk_size"])
+        except IngestError as e:
+            for error in e.errors:
+                self.stderr.write(json.dumps(error))
+            raise CommandError(f"{len(e.errors)} invalid rows, nothing was written")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {result['users']} users, {result['posts']} posts and {result['likes']} likes "
+            f"in {result['seconds']}s ({result['rows_per_second']} rows/sec)"
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from mainapp import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of post contents from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--optimize", action="store_true",
+            help="Also merge the index b-trees once rebuilt.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Full-text search needs the sqlite3 backend")
+
+        search.rebuild()
+        if options["optimize"]:
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}) VALUES ('optimize')")
+
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt"))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from mainapp.models import Post
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored like_count/repost_count of posts in chunks to repair drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--start-id", type=int, default=0,
+            help="Resume from this post_id.",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        last_id = Post.objects.aggregate(last=Max("post_id"))["last"] or 0
+        fixed = 0
+
+        # One short transaction per post_id range so writers are never
+        # blocked for the whole table.
+        for start in range(options["start_id"], last_id + 1, chunk_size):
+            with transaction.atomic():
+                chunk = Post.objects.filter(post_id__gte=start, post_id__lt=start + chunk_size)
+                drifted = list(chunk.drifted().values_list("post_id", flat=True))
+                if drifted:
+                    fixed += Post.objects.filter(post_id__in=drifted).recount()
+            self.stdout.write(f"Checked posts up to {min(start + chunk_size - 1, last_id)}, {fixed} repaired")
+
+        self.stdout.write(self.style.SUCCESS(f"Done, {fixed} posts repaired"))
@@ -0,0 +1,211 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# The RequestStats of the request being handled, if any. A context variable
+# rather than a thread local so it follows async views and sync_to_async.
+_current = ContextVar("mainapp_request_stats", default=None)
+
+
+class RequestStats:
+    __slots__ = ("queries", "sql_seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.statements = set()
+
+    @property
+    def duplicates(self):
+        """Queries whose SQL was already run by this request, the N+1 signal."""
+        return self.queries - len(self.statements)
+
+
+def query_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.sql_seconds += time.perf_counter() - started
+        stats.queries += 1
+        stats.statements.add(sql)
+
+
+def install_query_wrapper(connection):
+    """Called for every new database connection, see signals.py."""
+    if query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_wrapper)
+
+
+class ViewMetrics:
+    __slots__ = ("buckets", "requests", "seconds", "queries", "sql_seconds", "duplicates")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.requests = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.duplicates = 0
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = dict()
+        self._counters = Counter()
+
+    def record(self, view, seconds, stats):
+        with self._lock:
+            metrics = self._views.get(view)
+            if metrics is None:
+                metrics = self._views[view] = ViewMetrics()
+            metrics.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            metrics.requests += 1
+            metrics.seconds += seconds
+            metrics.queries += stats.queries
+            metrics.sql_seconds += stats.sql_seconds
+            metrics.duplicates += stats.duplicates
+
+    def count(self, name, amount=1):
+        """Add to the process-wide counter mainapp_<name>_total."""
+        with self._lock:
+            self._counters[name] += amount
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters[name]
+
+    def totals(self):
+        """(requests, queries) over every view."""
+        with self._lock:
+            return (
+                sum(m.requests for m in self._views.values()),
+                sum(m.queries for m in self._views.values()),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+            self._counters.clear()
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        with self._lock:
+            views = sorted(
+                (view, list(m.buckets), m.requests, m.seconds, m.queries, m.sql_seconds, m.duplicates)
+                for view, m in self._views.items()
+            )
+            counters = sorted(self._counters.items())
+
+        lines = [
+            "# HELP mainapp_request_duration_seconds Time spent handling requests.",
+            "# TYPE mainapp_request_duration_seconds histogram",
+        ]
+        for view, buckets, requests, seconds, *_ in views:
+            label = _escape(view)
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, buckets):
+                cumulative += count
+                lines.append(f'mainapp_request_duration_seconds_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'mainapp_request_duration_seconds_bucket{{view="{label}",le="+Inf"}} {requests}')
+            lines.append(f'mainapp_request_duration_seconds_sum{{view="{label}"}} {seconds}')
+            lines.append(f'mainapp_request_duration_seconds_count{{view="{label}"}} {requests}')
+
+        for index, name, help_text in (
+            (4, "mainapp_request_queries_total", "SQL queries run while handling requests."),
+            (5, "mainapp_request_sql_seconds_total", "Time spent in SQL while handling requests."),
+            (6, "mainapp_request_duplicate_queries_total", "Queries that repeated SQL already run by the same request."),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for row in views:
+                lines.append(f'{name}{{view="{_escape(row[0])}"}} {row[index]}')
+
+        for name, value in counters:
+            lines.append(f"# TYPE mainapp_{name}_total counter")
+            lines.append(f"mainapp_{name}_total {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Per process: with several workers, each scrape of /metrics sees the
+# numbers of whichever worker answers it.
+registry = Registry()
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "<unresolved>"
+    return match.url_name or match.route
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, query count, SQL time and duplicate queries of
+    every request by view, and logs a warning when a view runs more queries
+    than METRICS_QUERY_BUDGETS allows it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "METRICS_ENABLED", True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.budgets = getattr(settings, "METRICS_QUERY_BUDGETS", {})
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            _current.reset(token)
+            self.record(request, time.perf_counter() - started, stats)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            _current.reset(token)
+            self.record(request, time.perf_counter() - started, stats)
+
+    def record(self, request, seconds, stats):
+        view = _view_name(request)
+        registry.record(view, seconds, stats)
+
+        budget = self.budgets.get(view)
+        if budget is not None and stats.queries > budget:
+            logger.warning(
+                "%s ran %d queries (%d duplicates) for %s, over its budget of %d",
+                view, stats.queries, stats.duplicates, request.path, budget,
+            )
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0006_alter_user_email'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_at', '-post_id'], name='post_created_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:48
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counts(apps, schema_editor):
+    Post = apps.get_model("mainapp", "Post")
+    Like = Post.liker_id.through
+
+    def count_of(queryset, group_by):
+        counts = queryset.order_by().values(group_by).annotate(c=Count("*")).values("c")
+        return Coalesce(Subquery(counts), 0)
+
+    Post.objects.update(
+        like_count=count_of(Like.objects.filter(post_id=OuterRef("pk")), "post_id"),
+        repost_count=count_of(Post.objects.filter(repost_id=OuterRef("pk")), "repost_id"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0007_post_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='repost_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
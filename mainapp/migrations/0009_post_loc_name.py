@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0008_post_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='loc_name',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+    ]
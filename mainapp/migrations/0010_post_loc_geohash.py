@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0009_post_loc_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='loc_geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from mainapp import search
+
+    search.rebuild(schema_editor.connection)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from mainapp import search
+
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0010_post_loc_geohash'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
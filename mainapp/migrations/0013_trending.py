@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:20
+
+import time
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_state(apps, schema_editor):
+    TrendingState = apps.get_model("mainapp", "TrendingState")
+    TrendingState.objects.create(id=1, epoch=time.time())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0012_post_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='mainapp.post')),
+                ('score', models.FloatField(db_index=True, default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrendingState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('epoch', models.FloatField()),
+            ],
+        ),
+        migrations.RunPython(create_state, migrations.RunPython.noop),
+    ]
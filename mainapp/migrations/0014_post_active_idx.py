@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0013_trending'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('post_status', 'ACT')), fields=['-post_id'], name='post_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('post_status', 'ACT')), fields=['-created_at', '-post_id'], name='post_active_created_idx'),
+        ),
+    ]
@@ -1,9 +1,14 @@
-from django.db import models
+import time
+
+from django.db import connections, models, router
 from django.conf import settings
+from django.db.models.functions import Coalesce, Greatest, Now
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.hashers import make_password, check_password
 from django.contrib.auth.models import AbstractUser
 
+from .geo import encode_geohash
+
 class Status(models.TextChoices):
     ACTIVE = "ACT", _("Active")
     BANNED = "BAN", _("Banned")
@@ -29,9 +34,12 @@ class User(AbstractUser):
     
     def activate(self):
         self.user_status = Status.ACTIVE
+        self.is_active = True
         
     def ban(self):
+        # is_active=False is what makes the auth backends log the user out.
         self.user_status = Status.BANNED
+        self.is_active = False
     
     class Meta:
         ordering = ["username"]
@@ -41,13 +49,87 @@ class User(AbstractUser):
             models.Index(fields=["username"], name="username_idx"),
         ]
     
+def _count_subquery(queryset, group_by):
+    counts = queryset.order_by().values(group_by).annotate(c=models.Count("*")).values("c")
+    return Coalesce(models.Subquery(counts), 0)
+
+# Correlated COUNT subqueries instead of Count() over joins, so the two
+# relations don't multiply each other's rows.
+def _actual_like_count():
+    likes = Post.liker_id.through.objects.filter(post_id=models.OuterRef("pk"))
+    return _count_subquery(likes, "post_id")
+
+def _actual_repost_count():
+    reposts = Post.objects.filter(repost_id=models.OuterRef("pk"))
+    return _count_subquery(reposts, "repost_id")
+
+class PostQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(post_status=Status.ACTIVE)
+
+    def with_actual_counts(self):
+        return self.annotate(
+            actual_like_count=_actual_like_count(),
+            actual_repost_count=_actual_repost_count(),
+        )
+
+    def drifted(self):
+        return self.with_actual_counts().exclude(
+            like_count=models.F("actual_like_count"),
+            repost_count=models.F("actual_repost_count"),
+        )
+
+    def adjust_counts(self, likes=0, reposts=0):
+        fields = {"updated_at": Now()}
+        if likes:
+            fields["like_count"] = Greatest(models.F("like_count") + likes, 0)
+        if reposts:
+            fields["repost_count"] = Greatest(models.F("repost_count") + reposts, 0)
+        if not likes and not reposts:
+            return 0
+        updated = self.update(**fields)
+        weight = likes * getattr(settings, "TRENDING_LIKE_WEIGHT", 1.0) + reposts * getattr(settings, "TRENDING_REPOST_WEIGHT", 3.0)
+        if updated and weight:
+            TrendingScore.objects.bump(self, weight)
+        return updated
+
+    def recount(self):
+        return self.update(
+            like_count=_actual_like_count(),
+            repost_count=_actual_repost_count(),
+            updated_at=Now(),
+        )
+
+    def with_viewer_state(self, user):
+        if not user.is_authenticated:
+            return self.annotate(viewer_has_liked=models.Value(False))
+        return self.annotate(
+            viewer_has_liked=models.Exists(
+                Post.liker_id.through.objects.filter(
+                    post_id=models.OuterRef("pk"), user_id=user.pk
+                )
+            )
+        )
+
+    def timeline(self, user):
+        return (
+            self.active()
+            .select_related("poster_id", "repost_id", "repost_id__poster_id")
+            .with_viewer_state(user)
+        )
+
 class Post(models.Model):
     post_id = models.AutoField(primary_key=True)
     post_content = models.CharField(max_length=140, blank=True)
     loc_lon = models.FloatField(blank=True, null=True)
     loc_lat = models.FloatField(blank=True, null=True)
+    loc_name = models.CharField(max_length=200, blank=True)
+    loc_geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     post_status = models.CharField(max_length=3, choices=Status.choices)
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+    repost_count = models.PositiveIntegerField(default=0, editable=False)
     liker_id = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name="liked_posts", blank=True)
     poster_id = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -61,13 +143,96 @@ class Post(models.Model):
         related_name="repost"
     )
     
+    objects = PostQuerySet.as_manager()
+    
     def __str__(self):
          return f"{self.post_content[:10]}..."
     
+    def save(self, *args, **kwargs):
+        self.loc_geohash = self.compute_geohash()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"loc_lat", "loc_lon"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "loc_geohash"}
+        super().save(*args, **kwargs)
+    
+    def compute_geohash(self):
+        if self.loc_lat is None or self.loc_lon is None:
+            return ""
+        return encode_geohash(self.loc_lat, self.loc_lon)
+    
     class Meta:
         ordering = ["post_id"]
         verbose_name = "post"
         verbose_name_plural = "posts"
         indexes = [
             models.Index(fields=["post_id"], name="post_id_idx"),
-        ]
\ No newline at end of file
+            models.Index(fields=["-created_at", "-post_id"], name="post_created_idx"),
+            # The dashboard and /api/posts only list active posts.
+            models.Index(
+                fields=["-post_id"], condition=models.Q(post_status=Status.ACTIVE), name="post_active_idx",
+            ),
+            models.Index(
+                fields=["-created_at", "-post_id"], condition=models.Q(post_status=Status.ACTIVE),
+                name="post_active_created_idx",
+            ),
+        ]
+
+
+class TrendingQuerySet(models.QuerySet):
+    def bump(self, posts, weight, now=None):
+        """
+        Add ``weight``, decayed from now, to the trending score of every
+        post in the ``posts`` queryset in one INSERT ... ON CONFLICT. See
+        TrendingScore for the units.
+
+        A negative weight (an unlike, a deleted repost) takes back an event
+        whose time isn't known, so it counts as of the epoch rather than
+        now: that never removes more than an event since the epoch added.
+        """
+        alias = posts._db or router.db_for_write(Post)
+        connection = connections[alias]
+        post_sql, params = posts.order_by().values("pk").query.get_compiler(alias).as_sql()
+        post_table = connection.ops.quote_name(Post._meta.db_table)
+        score_table = connection.ops.quote_name(TrendingScore._meta.db_table)
+        state_table = connection.ops.quote_name(TrendingState._meta.db_table)
+        now = time.time() if now is None else now
+        half_life = getattr(settings, "TRENDING_HALF_LIFE", 6 * 3600)
+
+        # Without a state row (a flushed test database) the epoch is now.
+        exponent = f"(%s - COALESCE((SELECT epoch FROM {state_table} WHERE id = 1), %s)) / %s"
+        if weight < 0:
+            exponent = f"MIN({exponent}, 0)"
+        sql = f"""
+            INSERT INTO {score_table} (post_id, score)
+            SELECT post_id, %s * POWER(2, {exponent})
+            FROM {post_table}
+            WHERE post_id IN ({post_sql})
+            ON CONFLICT (post_id) DO UPDATE SET score = MAX({score_table}.score + excluded.score, 0)
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, (weight, now, now, half_life, *params))
+
+
+class TrendingScore(models.Model):
+    """
+    Likes and reposts of a post, decayed exponentially with a half-life of
+    TRENDING_HALF_LIFE seconds.
+
+    Rather than decaying every row as time passes, an event at time t adds
+    its weight times 2 ** ((t - epoch) / half_life), so newer events count
+    for more and the stored scores rank posts correctly without being
+    touched. decay_trending (see mainapp/trending.py) periodically scales
+    all scores down to a new epoch and drops the ones that no longer matter.
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name="trending")
+    score = models.FloatField(default=0, db_index=True)
+
+    objects = TrendingQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.post_id}: {self.score:.3f}"
+
+
+class TrendingState(models.Model):
+    """The single row (id 1) holding the epoch of the trending scores, as a Unix time."""
+    epoch = models.FloatField()
@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models.functions import Now
+
+from . import threads
+from .backends import invalidate_users
+from .models import Post, Status, TrendingScore, User
+from .pagination import adjust_timeline_count
+
+
+def ban_users(user_ids, chunk_size=500, start_id=0, progress=None):
+    """
+    Ban ``user_ids``, which also logs them out, and mark every active post
+    and repost they made BANNED.
+
+    The posts are updated ``chunk_size`` at a time in order of post_id, one
+    short transaction per chunk, so the SQLite write lock is released
+    between chunks and live requests get their turn. Only active posts are
+    picked up, so running it again after an interruption carries on where
+    it stopped; ``start_id`` skips the posts below it. ``progress`` is
+    called with (last post_id, posts banned so far) after every chunk.
+    Returns the number of posts banned.
+    """
+    user_ids = list(user_ids)
+    with transaction.atomic():
+        # is_active=False ends their sessions and logins, as User.ban() does.
+        User.objects.filter(pk__in=user_ids).update(user_status=Status.BANNED, is_active=False)
+    # update() skips the post_save signal that drops the cached users.
+    invalidate_users(user_ids)
+
+    posts = Post.objects.active().filter(poster_id__in=user_ids, post_id__gte=start_id).order_by("post_id")
+    last_id = start_id - 1
+    banned = 0
+    while True:
+        with transaction.atomic():
+            post_ids = list(posts.filter(post_id__gt=last_id).values_list("post_id", flat=True)[:chunk_size])
+            if not post_ids:
+                break
+            # updated_at moves the posts' ETags and cached snippets on.
+            updated = Post.objects.active().filter(post_id__in=post_ids).update(
+                post_status=Status.BANNED, updated_at=Now(),
+            )
+            TrendingScore.objects.filter(post_id__in=post_ids).delete()
+            # Threads showing the posts, whether they sit above or below them.
+            transaction.on_commit(lambda post_ids=post_ids: threads.invalidate_threads(post_ids, descendants=True))
+        adjust_timeline_count(-updated)
+        last_id = post_ids[-1]
+        banned += updated
+        if progress is not None:
+            progress(last_id, banned)
+
+    return banned
@@ -0,0 +1,224 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+# SQLite integers are 64-bit; a larger id can't match a post and would
+# overflow as a query parameter.
+MAX_POST_ID = 2 ** 63 - 1
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(*values):
+    raw = json.dumps(values, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError):
+        raise InvalidCursor(cursor)
+
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor(cursor)
+
+    return values
+
+
+def encode_post_cursor(created_at, post_id):
+    # isoformat() keeps microseconds, which DjangoJSONEncoder would drop.
+    return encode_cursor(created_at.isoformat(), post_id)
+
+
+def decode_post_cursor(cursor):
+    created_at, post_id = decode_cursor(cursor, 2)
+    try:
+        created_at = parse_datetime(created_at)
+    except (TypeError, ValueError):
+        created_at = None
+    if created_at is None or not isinstance(post_id, int) or abs(post_id) > MAX_POST_ID:
+        raise InvalidCursor(cursor)
+
+    return created_at, post_id
+
+
+def _seek(queryset, after=None, before=None):
+    # The leading created_at bound is what lets SQLite seek the
+    # (created_at, post_id) index; the OR alone can only filter a scan.
+    if before:
+        created_at, post_id = decode_post_cursor(before)
+        return queryset.filter(
+            Q(created_at__gt=created_at)
+            | Q(created_at=created_at, post_id__gt=post_id),
+            created_at__gte=created_at,
+        ).order_by("created_at", "post_id")
+
+    queryset = queryset.order_by("-created_at", "-post_id")
+    if after:
+        created_at, post_id = decode_post_cursor(after)
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at)
+            | Q(created_at=created_at, post_id__lt=post_id),
+            created_at__lte=created_at,
+        )
+    return queryset
+
+
+def _page(rows, limit, before):
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before:
+        rows.reverse()
+
+    return rows, has_more
+
+
+def paginate_keyset(queryset, after=None, before=None, limit=5):
+    """
+    Newest-first page of ``queryset`` seeking on (created_at, post_id), so
+    the cost does not depend on how deep the page is. Returns the rows plus
+    whether more rows exist past the end in the direction of travel.
+    """
+    rows = list(_seek(queryset, after, before)[:limit + 1])
+    return _page(rows, limit, before)
+
+
+async def apaginate_keyset(queryset, after=None, before=None, limit=5):
+    """Async version of paginate_keyset()."""
+    rows = [row async for row in _seek(queryset, after, before)[:limit + 1]]
+    return _page(rows, limit, before)
+
+
+TIMELINE_COUNT_KEY = "timeline-count"
+
+
+def adjust_timeline_count(delta):
+    """Keep the cached timeline count in step with a post being added or removed."""
+    try:
+        cache.incr(TIMELINE_COUNT_KEY, delta)
+    except ValueError:
+        # Not cached; the next TimelinePaginator counts again.
+        pass
+
+
+class TimelinePage(Page):
+    """
+    A dashboard page. ``previous_query``/``next_query`` are the query strings
+    of its neighbours: ``page=`` while they are shallow enough for OFFSET,
+    seek cursors on post_id past ``seek_from``.
+    """
+
+    def __init__(self, object_list, number, paginator, has_previous=None, has_next=None):
+        super().__init__(object_list, number, paginator)
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def has_previous(self):
+        if self._has_previous is not None:
+            return self._has_previous
+        return super().has_previous()
+
+    def has_next(self):
+        if self._has_next is not None:
+            return self._has_next
+        return super().has_next()
+
+    @property
+    def seeking(self):
+        return self.number > self.paginator.seek_from
+
+    @property
+    def previous_query(self):
+        number = self.number - 1
+        if number <= self.paginator.seek_from or not self.object_list:
+            return f"page={number}"
+        return f"before={encode_cursor(self.object_list[0].post_id)}&page={number}"
+
+    @property
+    def next_query(self):
+        number = self.number + 1
+        if number <= self.paginator.seek_from or not self.object_list:
+            return f"page={number}"
+        return f"after={encode_cursor(self.object_list[-1].post_id)}&page={number}"
+
+    def page_links(self):
+        """
+        Page numbers to link around this page, with None for a gap. Pages
+        past ``seek_from`` are only reached through next/previous, so the
+        number of links doesn't grow with the number of posts.
+        """
+        paginator = self.paginator
+        # A seek page can be past the cached count while it catches up.
+        around = min(self.number, paginator.num_pages)
+        links = list()
+        for number in paginator.get_elided_page_range(around, on_each_side=2, on_ends=1):
+            if number == paginator.ELLIPSIS or (number > paginator.seek_from and number != self.number):
+                number = None
+            if number is not None or (links and links[-1] is not None):
+                links.append(number)
+        if self.number not in links:
+            links.append(self.number)
+        return links
+
+
+class TimelinePaginator(Paginator):
+    """
+    Newest-first paginator for the dashboard timeline (ordered by -post_id).
+
+    The total comes from the cache rather than a COUNT(*) per page view; it
+    is kept current by adjust_timeline_count() and counted again after
+    TIMELINE_COUNT_TIMEOUT seconds in case it drifted. Pages up to
+    ``seek_from`` are fetched with OFFSET, deeper ones by seeking on post_id
+    from the page before, see seek().
+    """
+
+    def __init__(self, object_list, per_page, seek_from=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if seek_from is None:
+            seek_from = getattr(settings, "TIMELINE_SEEK_FROM", 20)
+        self.seek_from = seek_from
+
+    @cached_property
+    def count(self):
+        count = cache.get(TIMELINE_COUNT_KEY)
+        if count is None:
+            count = self.object_list.count()
+            cache.set(TIMELINE_COUNT_KEY, count, getattr(settings, "TIMELINE_COUNT_TIMEOUT", 300))
+        return count
+
+    def _get_page(self, object_list, number, paginator):
+        # A list, so the cursors of previous_query/next_query don't query.
+        return TimelinePage(list(object_list), number, paginator)
+
+    def seek(self, after=None, before=None, number=1):
+        """
+        The page right after the post with the ``after`` cursor, or right
+        before the one with ``before``. ``number`` is only shown, the rows
+        come from an index seek however deep the page is.
+        """
+        post_id, = decode_cursor(after or before, 1)
+        if not isinstance(post_id, int) or abs(post_id) > MAX_POST_ID:
+            raise InvalidCursor(after or before)
+
+        if before:
+            queryset = self.object_list.filter(post_id__gt=post_id).order_by("post_id")
+        else:
+            queryset = self.object_list.filter(post_id__lt=post_id).order_by("-post_id")
+        rows, has_more = _page(list(queryset[:self.per_page + 1]), self.per_page, before)
+        if before:
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = True, has_more
+        return TimelinePage(rows, max(number, 1), self, has_previous=has_previous, has_next=has_next)
@@ -0,0 +1,73 @@
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections, transaction
+from django.urls import Resolver404, resolve
+
+REPLICA = "replica"
+
+# Set while handling a request whose reads may go to the replica.
+_use_replica = ContextVar("mainapp_use_replica", default=False)
+
+
+class ReadReplicaRouter:
+    """
+    Sends reads to the read-only "replica" alias while ReadReplicaMiddleware
+    allows it, and everything else to "default". Both aliases open the same
+    SQLite file, so the replica never lags; it only keeps readers on their
+    own connections, which WAL lets run alongside the writer.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _use_replica.get() or REPLICA not in connections:
+            return None
+        # Reads inside a transaction must see its uncommitted writes.
+        if transaction.get_connection().in_atomic_block:
+            return None
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
+
+
+class ReadReplicaMiddleware:
+    """Routes the reads of GET/HEAD requests to DATABASE_REPLICA_VIEWS to the replica."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.views = frozenset(getattr(settings, "DATABASE_REPLICA_VIEWS", ()))
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def uses_replica(self, request):
+        if request.method not in ("GET", "HEAD"):
+            return False
+        try:
+            return resolve(request.path_info).url_name in self.views
+        except Resolver404:
+            return False
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _use_replica.set(self.uses_replica(request))
+        try:
+            return self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+
+    async def __acall__(self, request):
+        token = _use_replica.set(self.uses_replica(request))
+        try:
+            return await self.get_response(request)
+        finally:
+            _use_replica.reset(token)
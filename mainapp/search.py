@@ -0,0 +1,122 @@
+import html
+import re
+
+from django.db import connection
+
+from .pagination import MAX_POST_ID, InvalidCursor, decode_cursor
+
+FTS_TABLE = "mainapp_post_fts"
+
+# External-content FTS5 index over mainapp_post.post_content, kept in sync
+# by triggers so bulk_create() and queryset.update() are covered as well.
+INSTALL_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        post_content, content='mainapp_post', content_rowid='post_id'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON mainapp_post BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, post_content) VALUES (new.post_id, new.post_content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON mainapp_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, post_content) VALUES ('delete', old.post_id, old.post_content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF post_content ON mainapp_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, post_content) VALUES ('delete', old.post_id, old.post_content);
+        INSERT INTO {FTS_TABLE}(rowid, post_content) VALUES (new.post_id, new.post_content);
+    END""",
+]
+
+UNINSTALL_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+HIGHLIGHT_START, HIGHLIGHT_END = "\x02", "\x03"
+
+
+def install(conn=connection):
+    """Create the index and its triggers if they are missing."""
+    if conn.vendor != "sqlite":
+        return
+    with conn.cursor() as cursor:
+        for sql in INSTALL_SQL:
+            cursor.execute(sql)
+
+
+def restore_triggers(conn=connection):
+    """
+    SQLite migrations that rebuild mainapp_post drop its triggers, so put
+    them back after every migrate once the index exists.
+    """
+    if conn.vendor == "sqlite" and FTS_TABLE in conn.introspection.table_names():
+        install(conn)
+
+
+def uninstall(conn=connection):
+    if conn.vendor != "sqlite":
+        return
+    with conn.cursor() as cursor:
+        for sql in UNINSTALL_SQL:
+            cursor.execute(sql)
+
+
+def rebuild(conn=connection):
+    install(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def to_match_expression(query):
+    # Quote every word so user input can never be FTS5 syntax, and let the
+    # last one match as a prefix for search-as-you-type.
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return " ".join(f'"{w}"' for w in words) + "*"
+
+
+def search_posts(query, limit=10, after=None):
+    """
+    Ids of the posts matching ``query``, best bm25 rank first, as a list of
+    ``(post_id, rank, highlighted_snippet)``. ``after`` is a cursor made of
+    the (rank, post_id) of the last row already seen.
+    """
+    match = to_match_expression(query)
+    if match is None:
+        return []
+
+    sql = f"""
+        SELECT rowid, bm25({FTS_TABLE}),
+               snippet({FTS_TABLE}, 0, %s, %s, '…', 16)
+        FROM {FTS_TABLE}
+        WHERE {FTS_TABLE} MATCH %s
+    """
+    params = [HIGHLIGHT_START, HIGHLIGHT_END, match]
+    if after:
+        rank, post_id = decode_cursor(after, 2)
+        # Both are bound as SQLite parameters, which must fit in 64 bits.
+        if (
+            not isinstance(rank, (int, float)) or not isinstance(post_id, int)
+            or abs(rank) > MAX_POST_ID or abs(post_id) > MAX_POST_ID
+        ):
+            raise InvalidCursor(after)
+        sql += f" AND (bm25({FTS_TABLE}) > %s OR (bm25({FTS_TABLE}) = %s AND rowid > %s))"
+        params += [rank, rank, post_id]
+    sql += f" ORDER BY bm25({FTS_TABLE}), rowid LIMIT %s"
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [
+            (post_id, rank, _highlight(snippet))
+            for post_id, rank, snippet in cursor.fetchall()
+        ]
+
+
+def _highlight(snippet):
+    return (
+        html.escape(snippet)
+        .replace(HIGHLIGHT_START, "<mark>")
+        .replace(HIGHLIGHT_END, "</mark>")
+    )
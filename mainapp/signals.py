@@ -0,0 +1,91 @@
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from . import events, metrics, search, threads
+from .backends import invalidate_user
+from .models import Post, Status, User
+from .pagination import adjust_timeline_count
+
+Like = Post.liker_id.through
+
+@receiver(m2m_changed, sender=Like)
+def update_like_count(sender, instance, action, reverse, pk_set, **kwargs):
+    # `reverse` is True for user.liked_posts.add(...), where pk_set holds
+    # post ids instead of user ids.
+    if action == "post_add" and pk_set:
+        # Django only reports the rows it actually inserted for add().
+        if reverse:
+            Post.objects.filter(pk__in=pk_set).adjust_counts(likes=1)
+        else:
+            Post.objects.filter(pk=instance.pk).adjust_counts(likes=len(pk_set))
+    elif action in ("pre_remove", "pre_clear"):
+        # remove() reports what was asked for, not what existed, so find
+        # the links that are really about to go before they are deleted.
+        if reverse:
+            links = Like.objects.filter(user_id=instance.pk)
+            if pk_set is not None:
+                links = links.filter(post_id__in=pk_set)
+        else:
+            links = Like.objects.filter(post_id=instance.pk)
+            if pk_set is not None:
+                links = links.filter(user_id__in=pk_set)
+        instance._removed_like_posts = list(links.values_list("post_id", flat=True))
+    elif action in ("post_remove", "post_clear"):
+        post_ids = instance.__dict__.pop("_removed_like_posts", [])
+        if not post_ids:
+            return
+        if reverse:
+            Post.objects.filter(pk__in=post_ids).adjust_counts(likes=-1)
+        else:
+            Post.objects.filter(pk=instance.pk).adjust_counts(likes=-len(post_ids))
+
+def _repost_count_changed(post_id):
+    # After the commit, so subscribers never see a count that is rolled
+    # back, and a thread read before the commit can't be cached again
+    # under the new generation.
+    def changed():
+        threads.invalidate_thread(post_id)
+        events.publish_counts(post_id)
+
+    transaction.on_commit(changed)
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        transaction.on_commit(lambda: adjust_timeline_count(1))
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    # Banned posts were already taken off the count by moderation.ban_users().
+    if instance.post_status == Status.ACTIVE:
+        transaction.on_commit(lambda: adjust_timeline_count(-1))
+
+@receiver(post_save, sender=Post)
+def count_new_repost(sender, instance, created, raw, **kwargs):
+    if created and not raw and instance.repost_id_id:
+        Post.objects.filter(pk=instance.repost_id_id).adjust_counts(reposts=1)
+        _repost_count_changed(instance.repost_id_id)
+
+@receiver(post_delete, sender=Post)
+def count_deleted_repost(sender, instance, **kwargs):
+    if instance.repost_id_id:
+        Post.objects.filter(pk=instance.repost_id_id).adjust_counts(reposts=-1)
+        _repost_count_changed(instance.repost_id_id)
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    if sender.name == "mainapp":
+        search.restore_triggers(connections[using])
+
+@receiver(connection_created)
+def install_query_metrics(sender, connection, **kwargs):
+    metrics.install_query_wrapper(connection)
+
+# Covers password changes, bans and last_login updates as long as the user
+# is saved; queryset.update() callers must call invalidate_users() themselves.
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
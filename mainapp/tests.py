@@ -1,3 +1,787 @@
-from django.test import TestCase
+import importlib
+import json
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+
+from . import events, export, geocoding, ingest, likes, moderation, routers, search, threads, trending
+from .models import Post, Status, TrendingScore, TrendingState, User
+from .pagination import TimelinePaginator, _seek, decode_cursor, encode_cursor, encode_post_cursor
+
+Like = Post.liker_id.through
+
+
+def make_user(username):
+    return User.objects.create(username=username, display_name=username.title(), user_status=Status.ACTIVE)
+
+
+def make_post(user, repost=None, content="post"):
+    return Post.objects.create(post_content=content, poster_id=user, post_status=Status.ACTIVE, repost_id=repost)
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    def route(self, method, path):
+        seen = []
+
+        def get_response(request):
+            seen.append(routers.ReadReplicaRouter().db_for_read(Post))
+            return None
+
+        middleware = routers.ReadReplicaMiddleware(get_response)
+        middleware(getattr(RequestFactory(), method)(path))
+        self.assertIsNone(routers.ReadReplicaRouter().db_for_read(Post))
+        return seen[0]
+
+    def test_listed_views_read_from_the_replica(self):
+        self.assertEqual(self.route("get", "/api/posts"), routers.REPLICA)
+        self.assertEqual(self.route("head", "/api/posts/1"), routers.REPLICA)
+
+    def test_everything_else_reads_from_default(self):
+        self.assertIsNone(self.route("post", "/api/posts/batch"))
+        self.assertIsNone(self.route("get", "/api/posts/export"))
+        self.assertIsNone(self.route("get", "/no/such/page"))
+
+    def test_transactions_read_their_own_writes(self):
+        token = routers._use_replica.set(True)
+        self.addCleanup(routers._use_replica.reset, token)
+        self.assertEqual(routers.ReadReplicaRouter().db_for_read(Post), routers.REPLICA)
+        with mock.patch.object(connection, "in_atomic_block", True):
+            self.assertIsNone(routers.ReadReplicaRouter().db_for_read(Post))
+
+    def test_writes_and_migrations_stay_on_default(self):
+        router = routers.ReadReplicaRouter()
+        self.assertEqual(router.db_for_write(Post), "default")
+        self.assertFalse(router.allow_migrate(routers.REPLICA, "mainapp"))
+        self.assertTrue(router.allow_migrate("default", "mainapp"))
+
+
+class TestRunnerTests(TestCase):
+    def test_tests_get_a_private_cache(self):
+        self.assertIsInstance(caches["default"], LocMemCache)
+
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.client.force_login(self.alice)
+
+    def queries(self, url):
+        cache.clear()
+        self.client.force_login(self.alice)
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(captured)
+
+    def add_posts(self, root, count):
+        for _ in range(count):
+            poster = make_user(f"poster{User.objects.count()}")
+            post = make_post(poster, repost=root)
+            post.liker_id.add(self.bob)
+
+    def test_dashboard_queries_do_not_grow_with_the_page(self):
+        root = make_post(self.bob)
+        self.add_posts(root, 1)
+        few = self.queries("/")
+        self.add_posts(root, 3)
+        self.assertEqual(self.queries("/"), few)
+
+    def test_detail_queries_do_not_grow_with_the_reposts(self):
+        root = make_post(self.bob)
+        self.add_posts(root, 1)
+        few = self.queries(f"/post/{root.pk}")
+        self.add_posts(root, 5)
+        self.assertEqual(self.queries(f"/post/{root.pk}"), few)
+
+    def test_viewer_has_liked_is_per_viewer(self):
+        liked, other = make_post(self.bob), make_post(self.bob)
+        liked.liker_id.add(self.alice)
+        other.liker_id.add(self.bob)
+        posts = {post.pk: post for post in Post.objects.timeline(self.alice)}
+        self.assertTrue(posts[liked.pk].viewer_has_liked)
+        self.assertFalse(posts[other.pk].viewer_has_liked)
+        html = self.client.get("/").content.decode()
+        self.assertIn(f'like-btn active"\n  data-id="{liked.pk}"', html)
+        self.assertNotIn(f'like-btn active"\n  data-id="{other.pk}"', html)
+
+
+class GeocodingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "cities.csv"
+        self.path.write_text("name,country,lat,lon\nJakarta,ID,-6.21,106.85\nBandung,ID,-6.92,107.61\n")
+        self.addCleanup(self.unload)
+
+    def unload(self):
+        geocoding._gazetteer = None
+        geocoding._lookup.cache_clear()
+
+    def test_nearest_city_within_range(self):
+        geocoding.load_gazetteer(self.path)
+        self.assertEqual(geocoding.reverse_geocode(-6.2, 106.8), "Jakarta, ID")
+        self.assertEqual(geocoding.reverse_geocode(-6.9, 107.6), "Bandung, ID")
+        self.assertEqual(geocoding.reverse_geocode(35.7, 139.7), "")
+
+    def test_loaded_when_a_worker_starts(self):
+        from ldic_test import wsgi
+
+        geocoding._gazetteer = None
+        with override_settings(GEOCODER_GAZETTEER=self.path):
+            importlib.reload(wsgi)
+        self.assertEqual(len(geocoding._gazetteer.places), 2)
+
+
+class AllPostApiTests(TestCase):
+    def test_page_past_the_end_is_empty(self):
+        make_post(make_user("alice"))
+        for page in ("1", "99999999999999999999"):
+            response = self.client.get(f"/api/posts?page={page}")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["posts"], [])
+
+    def assertChanged(self, url, response):
+        # A client that cached the page just now, by either validator.
+        for headers in ({"If-None-Match": response["ETag"]}, {"If-Modified-Since": http_date(time.time() + 60)}):
+            self.assertEqual(self.client.get(url, headers=headers).status_code, 200, headers)
+
+    def test_new_post_changes_the_page(self):
+        alice = make_user("alice")
+        make_post(alice)
+        for url in ("/api/posts?page=0", "/api/posts?before="):
+            response = self.client.get(url)
+            self.assertNotIn("Last-Modified", response)
+            self.assertEqual(self.client.get(url, headers={"If-None-Match": response["ETag"]}).status_code, 304)
+            make_post(alice)
+            self.assertChanged(url, response)
+
+    def test_deleted_post_changes_the_page(self):
+        alice = make_user("alice")
+        posts = [make_post(alice) for _ in range(3)]
+        url = "/api/posts?page=0&max_post=5"
+        response = self.client.get(url)
+        posts[1].delete()
+        self.assertChanged(url, response)
+
+    def test_cursors_walk_the_timeline(self):
+        alice = make_user("alice")
+        post_ids = [make_post(alice).pk for _ in range(5)]
+        seen, cursor = list(), ""
+        while cursor is not None:
+            data = self.client.get(f"/api/posts?after={cursor}&max_post=2").json()
+            seen += [post["post_id"] for post in data["posts"]]
+            cursor = data["next"]
+        self.assertEqual(seen, post_ids[::-1])
+        data = self.client.get(f"/api/posts?before={data['previous']}&max_post=2").json()
+        self.assertEqual([post["post_id"] for post in data["posts"]], post_ids[2:0:-1])
+
+    def test_cursor_seeks_the_index(self):
+        cursor = encode_post_cursor(timezone.now(), 10)
+        for direction in ("after", "before"):
+            queryset = _seek(Post.objects.active(), **{direction: cursor})[:6]
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as c:
+                c.execute("EXPLAIN QUERY PLAN " + sql, params)
+                plan = " ".join(row[-1] for row in c.fetchall())
+            self.assertRegex(plan, r"SEARCH mainapp_post USING INDEX \w+ \(created_at[<>]\?\)")
+
+    def test_out_of_range_cursor_is_rejected(self):
+        cursor = encode_post_cursor(timezone.now(), 2 ** 64)
+        self.assertEqual(self.client.get(f"/api/posts?after={cursor}").status_code, 400)
+
+class PostApiTests(TestCase):
+    def etag_changes(self, url, change):
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": etag}).status_code, 304)
+        change()
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": etag}).status_code, 200)
+
+    def test_included_rows_are_part_of_the_etag(self):
+        alice = make_user("alice")
+        original = make_post(make_user("bob"))
+        post = make_post(alice, repost=original)
+        url = f"/api/posts/{post.pk}?include=poster,repost"
+        self.assertNotIn("Last-Modified", self.client.get(url))
+
+        def rename():
+            alice.display_name = "Alice B."
+            alice.save()
+        self.etag_changes(url, rename)
+
+        def edit():
+            original.post_content = "edited"
+            original.save()
+        self.etag_changes(url, edit)
+        self.assertEqual(self.client.get(url).json()["repost"]["post_content"], "edited")
+
+    def test_post_alone_keeps_last_modified(self):
+        post = make_post(make_user("alice"))
+        response = self.client.get(f"/api/posts/{post.pk}")
+        self.assertIn("Last-Modified", response)
+        headers = {"If-Modified-Since": response["Last-Modified"]}
+        self.assertEqual(self.client.get(f"/api/posts/{post.pk}", headers=headers).status_code, 304)
+
+
+class TimelinePaginatorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        alice = make_user("alice")
+        self.post_ids = [make_post(alice).pk for _ in range(12)][::-1]
+
+    def paginator(self):
+        return TimelinePaginator(Post.objects.active().order_by("-post_id"), 2, seek_from=2)
+
+    def ids(self, page):
+        return [post.pk for post in page.object_list]
+
+    def cursor(self, query):
+        params = dict(part.split("=") for part in query.split("&"))
+        return {key: value for key, value in params.items() if key in ("after", "before")}
+
+    def test_seek_past_seek_from(self):
+        paginator = self.paginator()
+        self.assertEqual(paginator.page(1).next_query, "page=2")
+        page = paginator.page(2)
+        self.assertTrue(page.next_query.startswith("after="))
+        self.assertEqual(decode_cursor(self.cursor(page.next_query)["after"], 1), [self.post_ids[3]])
+
+        page = paginator.seek(number=3, **self.cursor(page.next_query))
+        self.assertEqual(self.ids(page), self.post_ids[4:6])
+        self.assertEqual(page.previous_query, "page=2")
+        page = paginator.seek(number=4, **self.cursor(page.next_query))
+        self.assertEqual(self.ids(page), self.post_ids[6:8])
+        self.assertTrue(page.has_previous() and page.has_next())
+        page = paginator.seek(number=3, **self.cursor(page.previous_query))
+        self.assertEqual(self.ids(page), self.post_ids[4:6])
+
+        last = paginator.seek(after=encode_cursor(self.post_ids[9]), number=6)
+        self.assertEqual(self.ids(last), self.post_ids[10:])
+        self.assertFalse(last.has_next())
+
+    def test_page_links_stop_at_seek_from(self):
+        paginator = self.paginator()
+        self.assertEqual(paginator.page(1).page_links(), [1, 2, None])
+        self.assertEqual(paginator.seek(after=encode_cursor(self.post_ids[7]), number=5).page_links(), [1, 2, None, 5, None])
+
+    def test_count_is_cached_and_kept_in_step(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.paginator().count, 12)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.paginator().count, 12)
+        with self.captureOnCommitCallbacks(execute=True):
+            post = make_post(User.objects.get(username="alice"))
+        self.assertEqual(self.paginator().count, 13)
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        self.assertEqual(self.paginator().count, 12)
+
+@override_settings(METRICS_TOKEN="s3cret")
+class MetricsTests(TestCase):
+    def test_staff_or_token_only(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        response = self.client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('mainapp_request_queries_total{view="metrics"}', response.content.decode())
+        user = make_user("alice")
+        self.client.force_login(user)
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+
+class NearbyPostApiTests(TestCase):
+    def test_runs_within_its_query_budget(self):
+        post = Post(post_content="here", poster_id=make_user("alice"), post_status=Status.ACTIVE, loc_lat=1.0, loc_lon=1.0)
+        post.loc_geohash = post.compute_geohash()
+        post.save()
+        with self.assertNumQueries(settings.METRICS_QUERY_BUDGETS["nearby_post"]):
+            response = self.client.get("/api/posts/nearby?lat=1&lon=1")
+        self.assertEqual([data["post_id"] for data in response.json()["posts"]], [post.pk])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.alice = make_user("alice")
+
+    def found(self, query):
+        return [post_id for post_id, _, _ in search.search_posts(query)]
+
+    def test_index_follows_inserts_updates_and_deletes(self):
+        post = make_post(self.alice, content="hello world")
+        self.assertEqual(self.found("hello"), [post.pk])
+        post.post_content = "goodbye world"
+        post.save()
+        self.assertEqual(self.found("hello"), [])
+        self.assertEqual(self.found("goodb"), [post.pk])
+        Post.objects.filter(pk=post.pk).update(post_content="bulk update")
+        self.assertEqual(self.found("goodbye"), [])
+        self.assertEqual(self.found("bulk"), [post.pk])
+        post.delete()
+        self.assertEqual(self.found("bulk"), [])
+
+    def test_cursor_pages_through_every_match(self):
+        post_ids = {make_post(self.alice, content=f"apple {'pie ' * i}").pk for i in range(5)}
+        make_post(self.alice, content="banana")
+        seen, cursor = list(), ""
+        while cursor is not None:
+            data = self.client.get(f"/api/posts/search?q=apple&max_post=2&after={cursor}").json()
+            seen += [post["post_id"] for post in data["posts"]]
+            self.assertTrue(all("<mark>apple</mark>" in post["snippet"] for post in data["posts"]))
+            cursor = data["next"]
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(set(seen), post_ids)
+
+    def test_out_of_range_cursor_is_rejected(self):
+        for cursor in (encode_cursor(-1.5, 2 ** 64), encode_cursor(10 ** 30, 1), encode_cursor("x", 1)):
+            response = self.client.get(f"/api/posts/search?q=apple&after={cursor}")
+            self.assertEqual(response.status_code, 400)
+
+
+class IdListTests(TestCase):
+    def test_out_of_range_ids_are_rejected(self):
+        huge = "99999999999999999999"
+        for url in ("/api/posts/likes", "/api/posts/batch", "/api/posts/events"):
+            response = self.client.get(f"{url}?ids=1,{huge}")
+            self.assertEqual(response.status_code, 400, url)
+        response = self.client.post("/api/posts/batch", {"ids": [int(huge)]}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class BatchApiTests(TestCase):
+    def setUp(self):
+        alice = make_user("alice")
+        self.posts = [make_post(alice) for _ in range(3)]
+        self.posts.append(make_post(alice, repost=self.posts[0]))
+
+    def test_posts_in_the_order_asked_for(self):
+        first, second, third, repost = (post.pk for post in self.posts)
+        ids = [third, repost, first, third, 999999, first]
+        for response in (
+            self.client.get(f"/api/posts/batch?ids={','.join(map(str, ids))}"),
+            self.client.post("/api/posts/batch", {"ids": ids}, content_type="application/json"),
+        ):
+            data = response.json()
+            self.assertEqual([post["post_id"] for post in data["posts"]], [third, repost, first])
+            self.assertEqual(data["missing"], [999999])
+
+    def test_queries_do_not_grow_with_the_batch(self):
+        ids = ",".join(str(post.pk) for post in self.posts)
+        with CaptureQueriesContext(connection) as one:
+            self.client.get(f"/api/posts/batch?ids={self.posts[0].pk}")
+        with self.assertNumQueries(len(one)):
+            response = self.client.get(f"/api/posts/batch?ids={ids}")
+        self.assertEqual(len(response.json()["posts"]), 4)
+
+
+class EventTests(TestCase):
+    async def test_changes_within_the_window_are_coalesced(self):
+        hub = events.Hub(window=0.05)
+        subscription = hub.subscribe([1, 2])
+        with mock.patch.object(hub, "flush", wraps=hub.flush) as flush:
+            hub.publish(1, like_count=1)
+            hub.publish(1, like_count=2)
+            hub.publish(1, repost_count=5)
+            hub.publish(3, like_count=9)
+            self.assertEqual(await subscription.get(1), [{"post_id": 1, "like_count": 2, "repost_count": 5}])
+        self.assertEqual(flush.call_count, 1)
+        self.assertEqual(await subscription.get(0.1), [])
+        hub.unsubscribe(subscription)
+        self.assertFalse(hub.has_subscribers(1))
+
+    async def test_stream_starts_with_the_stored_counts(self):
+        post = await sync_to_async(make_post)(await sync_to_async(make_user)("alice"))
+        stream = events.stream([post.pk], keepalive=0.01)
+        counts = {"post_id": post.pk, "like_count": 0, "repost_count": 0}
+        self.assertEqual(await anext(stream), events.format_event(counts))
+        self.assertEqual(await anext(stream), ": keepalive\n\n")
+        await stream.aclose()
+        self.assertFalse(events.hub.has_subscribers(post.pk))
+
+    def test_wsgi_sends_the_counts_once(self):
+        post = make_post(make_user("alice"))
+        response = self.client.get(f"/api/posts/events?ids={post.pk}")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(response.content.decode(), "retry: 15000\n\n" + events.format_event(
+            {"post_id": post.pk, "like_count": 0, "repost_count": 0}))
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.post = make_post(self.alice)
+
+    def counts(self, post=None):
+        post = post or self.post
+        post.refresh_from_db(fields=["like_count", "repost_count"])
+        return post.like_count, post.repost_count
+
+    def test_like_relation_keeps_like_count(self):
+        self.post.liker_id.add(self.alice, self.bob)
+        self.post.liker_id.add(self.alice)
+        self.assertEqual(self.counts(), (2, 0))
+        self.bob.liked_posts.remove(self.post)
+        self.bob.liked_posts.remove(self.post)
+        self.assertEqual(self.counts(), (1, 0))
+        self.bob.liked_posts.add(self.post)
+        self.post.liker_id.clear()
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_reposts_keep_repost_count(self):
+        repost = make_post(self.bob, repost=self.post)
+        make_post(self.alice, repost=self.post)
+        self.assertEqual(self.counts(), (0, 2))
+        repost.delete()
+        self.assertEqual(self.counts(), (0, 1))
+        self.assertFalse(Post.objects.drifted().exists())
+
+    def test_repost_drops_the_cached_thread_on_commit(self):
+        self.assertEqual(threads.get_thread(self.post.pk)["post"]["reposts"], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            repost = make_post(self.bob, repost=self.post)
+            # A reader before the commit still gets the cached thread; had
+            # the generation moved on already, it could cache the old
+            # thread under the new one.
+            self.assertEqual(threads.get_thread(self.post.pk)["post"]["reposts"], [])
+        reposts = threads.get_thread(self.post.pk)["post"]["reposts"]
+        self.assertEqual([node["post_id"] for node in reposts], [repost.pk])
+
+    def test_thread_generations_expire(self):
+        make_post(self.bob, repost=self.post)
+        with mock.patch.object(cache, "set_many") as set_many:
+            threads.invalidate_thread(self.post.pk)
+        keys, timeout = set_many.call_args.args
+        self.assertEqual(list(keys), [f"thread-gen:{self.post.pk}"])
+        self.assertGreater(timeout, settings.THREAD_CACHE_TIMEOUT)
+
+    def test_out_of_range_thread_is_not_found(self):
+        self.client.force_login(self.alice)
+        for url in ("/api/posts/99999999999999999999/thread", "/post/99999999999999999999/thread"):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_toggle_like(self):
+        self.assertEqual(likes.toggle_like(self.post.pk, self.bob.pk), (True, 1))
+        self.assertEqual(likes.toggle_like(self.post.pk, self.alice.pk), (True, 2))
+        self.assertEqual(likes.toggle_like(self.post.pk, self.bob.pk), (False, 1))
+        self.assertEqual(set(self.post.liker_id.values_list("pk", flat=True)), {self.alice.pk})
+        self.assertEqual(self.counts(), (1, 0))
+
+    def test_toggle_like_view(self):
+        self.client.force_login(self.bob)
+        response = self.client.post(f"/post/{self.post.pk}/like/")
+        self.assertEqual(response.json(), {"liked": True, "total_likes": 1})
+        response = self.client.get(f"/api/posts/likes?ids={self.post.pk}")
+        self.assertEqual(response.json()["posts"][str(self.post.pk)], {"liked": True, "total_likes": 1})
+        self.assertEqual(self.client.post("/post/999/like/").status_code, 404)
+
+
+class LikeBufferTests(TestCase):
+    def setUp(self):
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.post = make_post(self.alice)
+        self.buffer = likes.LikeBuffer(max_pending=100, flush_interval=3600)
+
+    def tearDown(self):
+        if self.buffer._timer is not None:
+            self.buffer._timer.cancel()
+
+    def state(self):
+        self.post.refresh_from_db(fields=["like_count"])
+        rows = Like.objects.filter(post_id=self.post.pk).count()
+        return rows, self.post.like_count
+
+    def test_toggles_are_written_on_flush(self):
+        self.assertEqual(self.buffer.toggle(self.post.pk, self.bob.pk), (True, 1))
+        self.assertEqual(self.buffer.toggle(self.post.pk, self.alice.pk), (True, 2))
+        self.assertEqual(self.state(), (0, 0))
+        self.assertEqual(self.buffer.pending_likes([self.post.pk], self.bob.pk), {self.post.pk: True})
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self.state(), (2, 2))
+        self.assertEqual(self.buffer.toggle(self.post.pk, self.bob.pk), (False, 1))
+        self.buffer.flush()
+        self.assertEqual(self.state(), (1, 1))
+
+    def test_toggles_that_cancel_out_write_nothing(self):
+        self.buffer.toggle(self.post.pk, self.bob.pk)
+        self.assertEqual(self.buffer.toggle(self.post.pk, self.bob.pk), (False, 0))
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.state(), (0, 0))
+
+    def test_toggle_during_a_flush_builds_on_the_flushed_intent(self):
+        self.buffer.toggle(self.post.pk, self.bob.pk)
+        write = self.buffer._write
+        results = list()
+
+        def write_with_toggle(pending):
+            # The unlike arrives after flush() took the like, before it commits.
+            results.append(self.buffer.toggle(self.post.pk, self.bob.pk))
+            write(pending)
+
+        self.buffer._write = write_with_toggle
+        self.buffer.flush()
+        self.assertEqual(results, [(False, 0)])
+        self.assertEqual(self.state(), (1, 1))
+        self.buffer._write = write
+        self.buffer.flush()
+        self.assertEqual(self.state(), (0, 0))
+
+    def test_counts_follow_rows_that_really_change(self):
+        # Intents made stale by a write behind the buffer's back, e.g. by
+        # another worker: a like that already exists, an unlike of nothing.
+        self.post.liker_id.add(self.bob)
+        self.buffer._pending[(self.post.pk, self.bob.pk)] = (False, True)
+        self.buffer.flush()
+        self.assertEqual(self.state(), (1, 1))
+        self.buffer._pending[(self.post.pk, self.alice.pk)] = (True, False)
+        self.buffer.flush()
+        self.assertEqual(self.state(), (1, 1))
+
+    def test_failed_flush_keeps_the_intents(self):
+        self.buffer.toggle(self.post.pk, self.bob.pk)
+        write = self.buffer._write
+
+        def failing_write(pending):
+            self.buffer.toggle(self.post.pk, self.alice.pk)
+            raise RuntimeError("database is locked")
+
+        self.buffer._write = failing_write
+        with self.assertRaises(RuntimeError):
+            self.buffer.flush()
+        self.assertEqual(self.buffer.like_counts([self.post.pk]), {self.post.pk: 2})
+        self.buffer._write = write
+        self.buffer.flush()
+        self.assertEqual(self.state(), (2, 2))
+
+
+class IngestTests(TestCase):
+    def setUp(self):
+        self.alice = make_user("alice")
+
+    def test_every_post_row_is_validated_on_its_own(self):
+        rows = [
+            {"poster": "alice", "post_content": "first", "loc_lat": 1.5, "loc_lon": 2.5},
+            {"poster": "alice", "post_content": "", "loc_lat": 100, "loc_lon": 2.5},
+            {"poster": "alice", "post_content": "third"},
+        ]
+        with self.assertRaises(ingest.IngestError) as caught:
+            ingest.ingest({"posts": rows})
+        self.assertEqual([error["posts"] for error in caught.exception.errors], [1])
+
+        del rows[1]
+        self.assertEqual(ingest.ingest({"posts": rows})["posts"], 2)
+        posts = list(Post.objects.order_by("post_id").values_list("post_content", "loc_lat"))
+        self.assertEqual(posts, [("first", 1.5), ("third", None)])
+
+    def test_reposted_threads_are_invalidated_once_per_batch(self):
+        cache.clear()
+        root = make_post(self.alice)
+        child = make_post(self.alice, repost=root)
+        self.assertEqual(len(threads.get_thread(root.pk)["post"]["reposts"]), 1)
+        rows = [{"poster": "alice", "post_content": str(i), "repost_id": post_id} for i, post_id in enumerate([root.pk, child.pk] * 5)]
+        with CaptureQueriesContext(connection) as captured, self.captureOnCommitCallbacks(execute=True):
+            ingest.ingest({"posts": rows})
+        self.assertEqual(sum("WITH RECURSIVE ancestors" in query["sql"] for query in captured), 1)
+        thread = threads.get_thread(root.pk)["post"]
+        self.assertEqual(len(thread["reposts"]), 6)
+        self.assertEqual(len(thread["reposts"][0]["reposts"]), 5)
+
+
+@override_settings(EXPORT_TOKEN="s3cret")
+class ExportTests(TestCase):
+    def setUp(self):
+        alice, self.bob = make_user("alice"), make_user("bob")
+        self.post_ids = list()
+        for i in range(5):
+            post = make_post(alice, content=f"post {i}")
+            post.liker_id.add(self.bob)
+            self.post_ids.append(post.pk)
+
+    async def test_async_export_matches_the_sync_one(self):
+        since_id = self.post_ids[0]
+        lines = await sync_to_async(list)(export.export_posts(since_id=since_id, chunk_size=2))
+        self.assertEqual([json.loads(line)["post_id"] for line in lines], self.post_ids[1:])
+        self.assertEqual([line async for line in export.aexport_posts(since_id=since_id, chunk_size=2)], lines)
+
+    async def test_streams_asynchronously_under_asgi(self):
+        response = await self.async_client.get("/api/posts/export", headers={"Authorization": "Bearer s3cret"})
+        self.assertTrue(response.is_async)
+        rows = [json.loads(line) async for line in response.streaming_content]
+        self.assertEqual([row["post_id"] for row in rows], self.post_ids)
+        self.assertEqual(rows[0]["liker_id"], [self.bob.pk])
+
+    def test_streams_synchronously_under_wsgi(self):
+        response = self.client.get("/api/posts/export", headers={"Authorization": "Bearer s3cret"})
+        self.assertFalse(response.is_async)
+        self.assertEqual([json.loads(line)["post_id"] for line in response.streaming_content], self.post_ids)
+
+    def exported(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line)["post_id"] for line in response.streaming_content]
+
+    def test_staff_or_token_only(self):
+        for headers in ({}, {"Authorization": "Bearer wrong"}):
+            self.assertEqual(self.client.get("/api/posts/export", headers=headers).status_code, 403)
+        self.client.force_login(self.bob)
+        self.assertEqual(self.client.get("/api/posts/export").status_code, 403)
+        with override_settings(EXPORT_TOKEN=None):
+            response = self.client.get("/api/posts/export", headers={"Authorization": "Bearer None"})
+            self.assertEqual(response.status_code, 403)
+        self.bob.is_staff = True
+        self.bob.save()
+        self.assertEqual(self.exported("/api/posts/export"), self.post_ids)
+
+    def test_banned_posts_only_when_asked_for(self):
+        Post.objects.filter(pk=self.post_ids[0]).update(post_status=Status.BANNED)
+        self.client.defaults["HTTP_AUTHORIZATION"] = "Bearer s3cret"
+        self.assertEqual(self.exported("/api/posts/export"), self.post_ids[1:])
+        self.assertEqual(self.exported("/api/posts/export?all=1"), self.post_ids)
+
+
+class SnippetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user("alice")
+
+    def test_post_content_cannot_fill_in_the_viewer_parts(self):
+        content = "__snippet_csrf_token__ __snippet_like_button__"
+        post = make_post(self.alice, content=content)
+        self.client.force_login(self.alice)
+        for _ in range(2):  # rendered, then from the cache
+            html = self.client.get("/").content.decode()
+            self.assertIn(f'<div class="post-text mb-2">{content}</div>', html)
+            self.assertEqual(html.count(f'like-btn"\n  data-id="{post.pk}"'), 1)
+
+
+class StaticFilesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        cls.root = Path(directory.name)
+        cls.enterClassContext(override_settings(STATIC_ROOT=directory.name, STORAGES={
+            **settings.STORAGES,
+            "staticfiles": {"BACKEND": "mainapp.assets.CompressedManifestStaticFilesStorage"},
+        }))
+        call_command("collectstatic", interactive=False, verbosity=0)
+
+    async def test_served_under_asgi(self):
+        response = await self.async_client.get("/static/css/post-snippet.css")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], f"public, max-age={settings.STATIC_MAX_AGE}")
+
+    def test_hashed_names_are_immutable_and_gzipped(self):
+        manifest = json.loads((self.root / "staticfiles.json").read_text())
+        response = self.client.get(
+            "/static/" + manifest["paths"]["css/bootstrap.min.css"], headers={"Accept-Encoding": "gzip"},
+        )
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Content-Type"], "text/css; charset=utf-8")
+
+    def test_files_replaced_while_running_are_sent_whole(self):
+        path = self.root / "css" / "leaflet.css"
+        self.client.get("/static/css/post-snippet.css")
+        replacement = path.with_suffix(".new")
+        replacement.write_bytes(b"/* redeployed */\n" * 1000)
+        replacement.replace(path)
+        response = self.client.get("/static/css/leaflet.css")
+        self.assertEqual(response.content, path.read_bytes())
+        self.assertEqual(int(response["Content-Length"]), len(response.content))
+
+        path.write_bytes(b"/* again */")
+        self.assertEqual(self.client.get("/static/css/leaflet.css").content, b"/* redeployed */\n" * 1000)
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        self.alice = make_user("alice")
+        self.post = make_post(self.alice)
+        self.epoch = TrendingState.objects.get(pk=1).epoch
+
+    def score(self):
+        return TrendingScore.objects.get(post=self.post).score
+
+    def test_unlike_takes_back_no_more_than_a_like_added(self):
+        posts = Post.objects.filter(pk=self.post.pk)
+        TrendingScore.objects.bump(posts, 10, now=self.epoch)
+        TrendingScore.objects.bump(posts, -1, now=self.epoch + 24 * 3600)
+        self.assertAlmostEqual(self.score(), 9.0)
+
+    def test_ingested_likes_count(self):
+        bob = make_user("bob")
+        self.post.liker_id.add(bob)
+        liked = self.score()
+        ingest.ingest({"likes": [{"user": "alice", "post_id": self.post.pk}, {"user": "bob", "post_id": self.post.pk}]})
+        self.post.refresh_from_db(fields=["like_count"])
+        self.assertEqual(self.post.like_count, 2)
+        self.assertGreater(self.score(), liked)
+        self.assertLess(self.score(), liked * 2.01)
+
+    def test_top_posts_come_from_the_score_index(self):
+        posts = [make_post(self.alice) for _ in range(3)]
+        for score, post in enumerate(posts, 1):
+            TrendingScore.objects.bump(Post.objects.filter(pk=post.pk), score, now=self.epoch)
+        Post.objects.filter(pk=posts[2].pk).update(post_status=Status.BANNED)
+        response = self.client.get("/api/posts/trending?max_post=1")
+        self.assertEqual([data["post_id"] for data in response.json()["posts"]], [posts[1].pk])
+
+        sql, params = trending.trending_posts(limit=10).query.sql_with_params()
+        with connection.cursor() as c:
+            c.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(row[-1] for row in c.fetchall())
+        self.assertRegex(plan, r"SCAN \w+ USING COVERING INDEX mainapp_trendingscore_score")
+        self.assertNotIn("SCAN mainapp_post", plan)
+
+
+class BanTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user("alice")
+        self.post = make_post(self.alice)
+
+    def test_banned_user_cannot_post(self):
+        self.alice.set_password("secret")
+        self.alice.save()
+        self.client.force_login(self.alice)
+        self.client.get("/")  # caches request.user
+        self.assertEqual(moderation.ban_users([self.alice.pk]), 1)
+
+        for url in ("/", f"/post/{self.post.pk}"):
+            response = self.client.post(url, {"post_content": "still here", "repost_val": ""})
+            self.assertEqual(response.status_code, 302)
+            self.assertTrue(response["Location"].startswith("/login"), response["Location"])
+        self.assertFalse(Post.objects.filter(post_content="still here").exists())
+        self.assertFalse(self.client.login(username="alice", password="secret"))
+
+    def test_banned_posts_leave_cached_threads(self):
+        bob = make_user("bob")
+        repost = make_post(bob, repost=self.post)
+        reply = make_post(self.alice, repost=repost)
+        self.assertEqual(threads.get_thread(reply.pk)["ancestors"][0]["post_id"], self.post.pk)
+        self.assertEqual(len(threads.get_thread(self.post.pk)["post"]["reposts"]), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            moderation.ban_users([bob.pk])
+        self.assertEqual(threads.get_thread(self.post.pk)["post"]["reposts"], [])
+        self.assertEqual(threads.get_thread(reply.pk)["ancestors"], [])
+
+        self.client.force_login(self.alice)
+        for url in (f"/post/{repost.pk}/thread", f"/api/posts/{repost.pk}/thread"):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
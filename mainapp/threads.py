@@ -0,0 +1,191 @@
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .models import Post, Status
+from .pagination import MAX_POST_ID
+
+# Walks up the repost chain from the post and down its repost tree in one
+# statement. Each step down only follows the first `fanout` reposts of a
+# post (through the repost_id index), and the whole walk stops after
+# `max_nodes` rows so a viral thread can't blow up the query. Banned posts
+# are left out, and so is whatever is only reachable through them.
+THREAD_SQL = """
+WITH RECURSIVE
+ancestors(post_id, parent_id, depth) AS (
+    SELECT post_id, repost_id_id, 0 FROM mainapp_post
+    WHERE post_id = %(post_id)s AND post_status = %(active)s
+    UNION ALL
+    SELECT p.post_id, p.repost_id_id, a.depth - 1
+    FROM ancestors a JOIN mainapp_post p ON p.post_id = a.parent_id
+    WHERE a.depth > -%(max_ancestors)s AND p.post_status = %(active)s
+),
+descendants(post_id, parent_id, depth) AS (
+    SELECT post_id, repost_id_id, 0 FROM mainapp_post
+    WHERE post_id = %(post_id)s AND post_status = %(active)s
+    UNION ALL
+    SELECT p.post_id, p.repost_id_id, d.depth + 1
+    FROM descendants d JOIN mainapp_post p ON p.post_id IN (
+        SELECT c.post_id FROM mainapp_post c
+        WHERE c.repost_id_id = d.post_id AND c.post_status = %(active)s
+        ORDER BY c.post_id LIMIT %(fanout)s
+    )
+    WHERE d.depth < %(depth)s
+    LIMIT %(max_nodes)s
+),
+thread(post_id, parent_id, depth) AS (
+    SELECT * FROM ancestors WHERE depth < 0
+    UNION ALL
+    SELECT * FROM descendants
+)
+SELECT p.post_id, p.post_content, p.created_at, p.post_status, p.loc_name,
+       p.like_count, p.repost_count, p.poster_id_id,
+       t.parent_id, t.depth, u.username, u.display_name
+FROM thread t
+JOIN mainapp_post p ON p.post_id = t.post_id
+JOIN mainapp_user u ON u.user_id = p.poster_id_id
+ORDER BY t.depth, p.post_id
+"""
+
+# UNION rather than UNION ALL, so chains shared by several of the posts
+# are only walked once.
+ANCESTOR_IDS_SQL = """
+WITH RECURSIVE ancestors(post_id, parent_id) AS (
+    SELECT post_id, repost_id_id FROM mainapp_post WHERE post_id IN ({placeholders})
+    UNION
+    SELECT p.post_id, p.repost_id_id
+    FROM ancestors a JOIN mainapp_post p ON p.post_id = a.parent_id
+)
+SELECT post_id FROM ancestors
+"""
+
+# The reposts below the posts, down to the depth at which the posts fall
+# out of the reposts' ancestor chains.
+DESCENDANT_IDS_SQL = """
+WITH RECURSIVE descendants(post_id, depth) AS (
+    SELECT post_id, 0 FROM mainapp_post WHERE post_id IN ({placeholders})
+    UNION
+    SELECT p.post_id, d.depth + 1
+    FROM descendants d JOIN mainapp_post p ON p.repost_id_id = d.post_id
+    WHERE d.depth < %s
+)
+SELECT post_id FROM descendants
+"""
+
+MAX_ANCESTORS = 100
+MAX_NODES = 500
+
+
+def load_thread(post_id, depth=5, fanout=20):
+    """
+    The ancestor chain (root first) and the repost tree below ``post_id``,
+    or None if the post doesn't exist.
+    """
+    rows = Post.objects.raw(THREAD_SQL, {
+        "post_id": post_id,
+        "active": Status.ACTIVE,
+        "max_ancestors": MAX_ANCESTORS,
+        "depth": depth,
+        "fanout": fanout,
+        "max_nodes": MAX_NODES,
+    })
+
+    nodes = dict()
+    ancestors = list()
+    for row in rows:
+        node = {
+            "post_id": row.post_id,
+            "post_content": row.post_content,
+            "created_at": row.created_at,
+            "post_status": row.post_status,
+            "loc_name": row.loc_name,
+            "like_count": row.like_count,
+            "repost_count": row.repost_count,
+            "repost_id": row.parent_id,
+            "depth": row.depth,
+            "poster": {
+                "user_id": row.poster_id_id,
+                "username": row.username,
+                "display_name": row.display_name,
+            },
+        }
+        if row.depth < 0:
+            ancestors.append(node)
+        else:
+            node["reposts"] = list()
+            nodes[row.post_id] = node
+            if row.depth > 0 and row.parent_id in nodes:
+                nodes[row.parent_id]["reposts"].append(node)
+
+    if post_id not in nodes:
+        return None
+
+    return {
+        "ancestors": ancestors,
+        "post": nodes[post_id],
+    }
+
+
+def _generation_key(post_id):
+    return f"thread-gen:{post_id}"
+
+
+def _generation_timeout():
+    # Longer than the threads cached under a generation live, so when it
+    # expires and get_thread() falls back to generation 0, every entry
+    # cached under 0 before the first invalidation has expired too.
+    return 2 * getattr(settings, "THREAD_CACHE_TIMEOUT", 60)
+
+
+def get_thread(post_id, depth=5, fanout=20):
+    """load_thread() through the cache, see invalidate_thread()."""
+    if post_id > MAX_POST_ID:
+        # Can't exist, and would overflow as a query parameter.
+        return None
+    generation = cache.get(_generation_key(post_id), 0)
+    key = f"thread:{post_id}:{generation}:{depth}:{fanout}"
+    thread = cache.get(key)
+    if thread is None:
+        thread = load_thread(post_id, depth=depth, fanout=fanout)
+        if thread is not None:
+            cache.set(key, thread, getattr(settings, "THREAD_CACHE_TIMEOUT", 60))
+    return thread
+
+
+def invalidate_thread(post_id):
+    """
+    Drop the cached threads that contain the repost tree of ``post_id``,
+    i.e. those of the post itself and of every post up its repost chain.
+    Entries aren't deleted one by one: each post has a generation in its
+    cache keys, and moving it on makes the old entries unreachable.
+    """
+    invalidate_threads([post_id])
+
+
+def invalidate_threads(post_ids, chunk_size=500, descendants=False):
+    """
+    invalidate_thread() for many posts, moving each generation on once.
+    With ``descendants``, the threads of the reposts below the posts are
+    dropped too, as they show the posts in their ancestor chains.
+    """
+    post_ids = list(post_ids)
+    ancestor_ids = set()
+    with connection.cursor() as cursor:
+        for i in range(0, len(post_ids), chunk_size):
+            chunk = post_ids[i:i + chunk_size]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(ANCESTOR_IDS_SQL.format(placeholders=placeholders), chunk)
+            ancestor_ids.update(row[0] for row in cursor.fetchall())
+            if descendants:
+                cursor.execute(DESCENDANT_IDS_SQL.format(placeholders=placeholders), [*chunk, MAX_ANCESTORS])
+                ancestor_ids.update(row[0] for row in cursor.fetchall())
+
+    if ancestor_ids:
+        # A fresh random generation rather than a counter, so all of them
+        # go to the cache in one set_many().
+        cache.set_many(
+            {_generation_key(ancestor_id): secrets.token_hex(8) for ancestor_id in ancestor_ids},
+            _generation_timeout(),
+        )
@@ -0,0 +1,53 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+
+from .models import Post, TrendingScore, TrendingState
+
+
+def trending_posts(queryset=None, limit=10):
+    """
+    The ``limit`` posts of ``queryset`` (active posts by default) with the
+    highest trending score, highest first. Posts without a score are left
+    out.
+    """
+    if queryset is None:
+        queryset = Post.objects.active()
+    # Joined the other way round, SQLite scans every post the queryset
+    # matches (it has the partial index on active posts for that) and sorts
+    # them all by score. Walking the score index and checking each post
+    # with EXISTS stops after ``limit`` matches; only those are sorted.
+    top = (
+        TrendingScore.objects.filter(Exists(queryset.filter(pk=OuterRef("post"))))
+        .order_by("-score")
+        .values("post_id")[:limit]
+    )
+    return queryset.filter(pk__in=top).order_by("-trending__score")
+
+
+def decay(now=None):
+    """
+    Move the trending scores to a new epoch: scale every score by the decay
+    since the old one, so they keep their meaning but stay small, and
+    delete the ones below TRENDING_MIN_SCORE. Returns (scores kept, scores
+    deleted).
+    """
+    now = time.time() if now is None else now
+    half_life = getattr(settings, "TRENDING_HALF_LIFE", 6 * 3600)
+    min_score = getattr(settings, "TRENDING_MIN_SCORE", 0.01)
+
+    # One transaction, so a bump sees either the old epoch and scores or
+    # the new ones.
+    with transaction.atomic():
+        state, created = TrendingState.objects.select_for_update().get_or_create(pk=1, defaults={"epoch": now})
+        if not created and now > state.epoch:
+            factor = 2 ** (-(now - state.epoch) / half_life)
+            TrendingScore.objects.update(score=F("score") * factor)
+            state.epoch = now
+            state.save(update_fields=["epoch"])
+        deleted, _ = TrendingScore.objects.filter(score__lt=min_score).delete()
+        kept = TrendingScore.objects.count()
+
+    return kept, deleted
@@ -1,11 +1,12 @@
 from django.urls import path
 from django.views.generic.base import RedirectView
-from .views import UserFormView, PostFormView, DashboardView, login_view, logout_view, toggle_like, DetailedPostView, get_all_post_json, get_post_json
+from .views import UserFormView, PostFormView, DashboardView, login_view, logout_view, toggle_like, DetailedPostView, get_all_post_json, get_post_json, get_post_batch_json, get_like_state_json, get_post_events, get_trending_post_json, get_nearby_post_json, search_post_json, export_post_ndjson, ingest_json, ThreadView, get_thread_json, metrics_view
 
 urlpatterns = [
     path("", DashboardView.as_view(), name="dashboard"),
     path("post/", RedirectView.as_view(url="/")),
     path("post/<int:pk>", DetailedPostView.as_view(), name="detailed_post"),
+    path("post/<int:pk>/thread", ThreadView.as_view(), name="post_thread"),
     path("login", login_view, name="login"),
     path("logout", logout_view, name="logout"),
     path("signup", UserFormView.as_view()),
@@ -13,5 +14,16 @@ urlpatterns = [
     path("post/<int:pk>/like/", toggle_like, name="post_like"),
     
     path("api/posts", get_all_post_json, name="all_post"),
-    path("api/posts/<int:post_id>", get_post_json, name="post_detailed")
+    path("api/posts/likes", get_like_state_json, name="post_like_state"),
+    path("api/posts/events", get_post_events, name="post_events"),
+    path("api/posts/trending", get_trending_post_json, name="trending_post"),
+    path("api/posts/nearby", get_nearby_post_json, name="nearby_post"),
+    path("api/posts/search", search_post_json, name="search_post"),
+    path("api/posts/export", export_post_ndjson, name="export_post"),
+    path("api/posts/batch", get_post_batch_json, name="post_batch"),
+    path("api/posts/<int:post_id>", get_post_json, name="post_detailed"),
+    path("api/posts/<int:post_id>/thread", get_thread_json, name="post_thread_json"),
+    path("api/ingest", ingest_json, name="ingest"),
+    
+    path("metrics", metrics_view, name="metrics"),
 ]
\ No newline at end of file
@@ -1,17 +1,38 @@
+import hashlib
+import heapq
+import json
+import logging
+
 from django.shortcuts import render, redirect
-from django.http import HttpResponse, JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views import View
 from django.views.generic import TemplateView, DetailView
 from django.views.generic.edit import FormView
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods, require_POST
 from django.shortcuts import get_object_or_404
-from django.core.paginator import Paginator
+from django.core.handlers.asgi import ASGIRequest
 from django.forms.models import model_to_dict
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
+from . import events, likes, metrics, search, threads, trending
+from .decorators import acondition, staff_or_token
+from .export import aexport_posts, export_posts
 from .forms import UserForm, PostForm, LoginForm
+from .geo import bounding_box, covering_geohashes, haversine_km
+from .geocoding import reverse_geocode
+from .ingest import IngestError, ingest
 from .models import Post, Status, User
+from .pagination import MAX_POST_ID, InvalidCursor, TimelinePaginator, apaginate_keyset, encode_cursor, encode_post_cursor
+from .serializers import InvalidFields, PostSerializer
+
+logger = logging.getLogger(__name__)
 
 def login_view(request):
     if request.user.is_authenticated:
@@ -37,19 +58,37 @@ def logout_view(request):
     logout(request)
     return redirect("login")
 
+TRENDING_DASHBOARD_POSTS = 20
+
 class DashboardView(LoginRequiredMixin, TemplateView):
     template_name = "dashboard.html"
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        posts = Post.objects.all().order_by("-post_id")
+        posts = Post.objects.timeline(self.request.user).order_by("-post_id")
+        if self.request.GET.get("tab") == "trending":
+            posts = trending.trending_posts(posts, TRENDING_DASHBOARD_POSTS)
+            context["tab"] = "trending"
+            context["posts"] = likes.merge_pending(list(posts), self.request.user)
+            context["form"] = PostForm(initial={"repost_val": ""})
+            return context
+        
         page_number = self.request.GET.get("page", 1)
+        after = self.request.GET.get("after")
+        before = self.request.GET.get("before")
         
-        paginator = Paginator(posts, 5)
-        page_obj = paginator.get_page(page_number)
+        paginator = TimelinePaginator(posts, 5)
+        page_obj = None
+        if after or before:
+            try:
+                page_obj = paginator.seek(after, before, _parse_page(self.request))
+            except InvalidCursor:
+                pass
+        if page_obj is None:
+            page_obj = paginator.get_page(page_number)
 
-        context["posts"] = page_obj.object_list
+        context["posts"] = likes.merge_pending(page_obj.object_list, self.request.user)
         context["page_obj"] = page_obj
         
         context["form"] = PostForm(initial={"repost_val": ""})
@@ -59,7 +98,7 @@ class DashboardView(LoginRequiredMixin, TemplateView):
     def post(self, request, *args, **kwargs):
         form = PostForm(request.POST)
         if form.is_valid():
-            print(form.cleaned_data)
+            logger.debug("New post: %s", form.cleaned_data)
             form.instance.post_status = Status.ACTIVE
             form.instance.poster_id = self.request.user
             repost_val = form.cleaned_data.get("repost_val")
@@ -70,7 +109,9 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             if lat_val != None and lon_val != None:
                 form.instance.loc_lat = lat_val
                 form.instance.loc_lon = lon_val
-            form.save()
+            form.instance.loc_name = reverse_geocode(form.instance.loc_lat, form.instance.loc_lon)
+            with transaction.atomic():
+                form.save()
             return redirect("/")
         
         context = self.get_context_data()
@@ -83,9 +124,14 @@ class DetailedPostView(LoginRequiredMixin, DetailView):
     template_name = "post_detail.html"
     context_object_name = "post"
     
+    def get_queryset(self):
+        return Post.objects.timeline(self.request.user)
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
+        reposts = self.get_queryset().filter(repost_id=self.object).order_by("post_id")
+        context["reposts"] = likes.merge_pending([self.object, *reposts], self.request.user)[1:]
         context["form"] = PostForm(initial={"repost_val": ""})
         context["detailed_post"] = True
         
@@ -94,7 +140,7 @@ class DetailedPostView(LoginRequiredMixin, DetailView):
     def post(self, request, *args, **kwargs):
         form = PostForm(request.POST)
         if form.is_valid():
-            print(form.cleaned_data)
+            logger.debug("New post: %s", form.cleaned_data)
             form.instance.post_status = Status.ACTIVE
             form.instance.poster_id = self.request.user
             repost_val = form.cleaned_data.get("repost_val")
@@ -105,7 +151,9 @@ class DetailedPostView(LoginRequiredMixin, DetailView):
             if lat_val != None and lon_val != None:
                 form.instance.loc_lat = lat_val
                 form.instance.loc_lon = lon_val
-            form.save()
+            form.instance.loc_name = reverse_geocode(form.instance.loc_lat, form.instance.loc_lon)
+            with transaction.atomic():
+                form.save()
             return redirect("/")
         
         context = self.get_context_data()
@@ -113,29 +161,82 @@ class DetailedPostView(LoginRequiredMixin, DetailView):
         context["detailed_post"] = False
         return self.render_to_response(context)
     
+class ThreadView(LoginRequiredMixin, TemplateView):
+    template_name = "thread.html"
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        
+        thread = threads.get_thread(self.kwargs["pk"])
+        if thread is None:
+            raise Http404("Post not found")
+        context["thread"] = thread
+        
+        return context
+    
 @login_required
 def toggle_like(request, pk):
-    post = get_object_or_404(Post, pk=pk)
-
-    if request.user in post.liker_id.all():
-        post.liker_id.remove(request.user)
-        liked = False
-    else:
-        post.liker_id.add(request.user)
-        liked = True
+    get_object_or_404(Post.objects.only("post_id"), pk=pk)
+    
+    liked, total_likes = likes.toggle_like(pk, request.user.pk)
+    events.hub.publish(pk, like_count=total_likes)
 
     return JsonResponse({
         "liked": liked,
-        "total_likes": post.liker_id.count(),
+        "total_likes": total_likes,
+    })
+
+MAX_LIKE_STATE_IDS = 100
+
+def _parse_ids(value):
+    ids = list()
+    for part in value.split(","):
+        part = part.strip()
+        if not part.isdecimal() or int(part) > MAX_POST_ID:
+            return None
+        ids.append(int(part))
+    return ids
+
+async def get_like_state_json(request):
+    post_ids = _parse_ids(request.GET.get("ids", ""))
+    if post_ids is None:
+        return JsonResponse({'error': 'ids must be a comma separated list of post ids'}, status=400)
+    if len(post_ids) > MAX_LIKE_STATE_IDS:
+        return JsonResponse({'error': f'At most {MAX_LIKE_STATE_IDS} ids per request'}, status=400)
+    
+    return JsonResponse({
+        "posts": await likes.alike_states(post_ids, await request.auser()),
     })
 
+MAX_EVENT_IDS = 100
+
+# Under WSGI a stream would hold a worker thread per client, so the counts
+# are sent once and EventSource reconnects after this many milliseconds.
+EVENTS_WSGI_RETRY = 15000
+
+async def get_post_events(request):
+    post_ids = _parse_ids(request.GET.get("ids", ""))
+    if post_ids is None:
+        return JsonResponse({'error': 'ids must be a comma separated list of post ids'}, status=400)
+    if len(post_ids) > MAX_EVENT_IDS:
+        return JsonResponse({'error': f'At most {MAX_EVENT_IDS} ids per request'}, status=400)
+    
+    if not isinstance(request, ASGIRequest):
+        body = f"retry: {EVENTS_WSGI_RETRY}\n\n"
+        body += "".join([events.format_event(counts) async for counts in events.snapshot(post_ids)])
+        response = HttpResponse(body, content_type="text/event-stream")
+    else:
+        response = StreamingHttpResponse(events.stream(post_ids), content_type="text/event-stream")
+        response["X-Accel-Buffering"] = "no"
+    response["Cache-Control"] = "no-cache"
+    return response
+
 class UserFormView(FormView):
     form_class = UserForm
     template_name = "signup.html"
     success_url = "/"
     
     def form_valid(self, form):
-        print("FORM VALID CALLED")
         user = form.save(commit=False)
         user.set_password(form.cleaned_data["password"])
         user.activate()
@@ -143,7 +244,7 @@ class UserFormView(FormView):
         return redirect(self.get_success_url())
     
     def form_invalid(self, form):
-        print("ERRORS:", form.errors)
+        logger.info("Signup rejected: %s", form.errors.as_json())
         return super().form_invalid(form)
 
 class PostFormView(FormView):
@@ -155,70 +256,374 @@ class PostFormView(FormView):
         form.instance.post_status = Status.ACTIVE
         form.instance.poster_id = self.request.user
         form.save()
-        print(form.cleaned_data)
+        logger.debug("New post: %s", form.cleaned_data)
         return super().form_valid(form)
 
-def get_post_json(request, post_id):
+# The JSON read endpoints below are async views: under ASGI they await the
+# database instead of holding a worker thread (see ldic_test/asgi.py).
+
+def _representation(request):
+    """Tells apart the responses ?fields= and ?include= make for one resource."""
+    variant = request.GET.get("fields", ""), request.GET.get("include", "")
+    if variant == ("", ""):
+        return ""
+    return "-" + hashlib.md5(repr(variant).encode()).hexdigest()[:12]
+
+# Columns of the rows ?include= embeds that the post's own updated_at
+# doesn't follow. Users have no modification time, so what is shown of the
+# poster goes into the ETag as it is.
+INCLUDE_VALIDATORS = {
+    "poster": ("poster_id__username", "poster_id__display_name"),
+    "repost": ("repost_id__updated_at",),
+}
+
+async def _post_validators(request, post_id):
+    # Every change to a post or its like/repost counts bumps updated_at, so
+    # the validators only need that one indexed column, not the post and
+    # its likers.
+    include = {name.strip() for name in request.GET.get("include", "").split(",")}
+    related = [column for name in INCLUDE_VALIDATORS if name in include for column in INCLUDE_VALIDATORS[name]]
+    row = await Post.objects.filter(post_id=post_id).values_list("updated_at", *related).afirst()
+    if row is None:
+        return None, None
+    updated_at, *related = row
+    etag = f"{post_id}-{updated_at.timestamp():.6f}{_representation(request)}"
+    if not related:
+        return f'"{etag}"', updated_at
+    # updated_at can't vouch for the embedded rows, so no Last-Modified.
+    return f'"{etag}-{hashlib.md5(repr(related).encode()).hexdigest()[:12]}"', None
+
+@acondition(_post_validators)
+async def get_post_json(request, post_id):
     try:
-        post_obj = Post.objects.get(post_id=post_id)
-        post_dict = {
-            "post_id": post_obj.post_id,
-            "post_content": post_obj.post_content,
-            "loc_lon": post_obj.loc_lon,
-            "loc_lat": post_obj.loc_lat,
-            "created_at": post_obj.created_at,
-            "post_status": post_obj.post_status,
-            "liker_id": list(post_obj.liker_id.values_list("user_id", flat=True)),
-            "poster_id": post_obj.poster_id.user_id,
-        }
-        
-        if post_obj.repost_id:
-            post_dict["repost_id"] = post_obj.repost_id.post_id
-        
-        return JsonResponse(post_dict)
-    except Post.DoesNotExist:
+        serializer = PostSerializer.from_request(request)
+    except InvalidFields as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    row = await serializer.rows(Post.objects.filter(post_id=post_id)).afirst()
+    if row is None:
         return JsonResponse({'error': 'Post not found'}, status=404)
+    return JsonResponse((await serializer.aserialize([row]))[0])
 
-def get_all_post_json(request):
-    post_count = Post.objects.count()
-    posts_liker = Post.objects.prefetch_related("liker_id")
-    
-    posts_list = list()
-    
-    for p in posts_liker:
-        data = {
-            "post_id": p.post_id,
-            "post_content": p.post_content,
-            "loc_lon": p.loc_lon,
-            "loc_lat": p.loc_lat,
-            "created_at": p.created_at,
-            "post_status": p.post_status,
-            "liker_id": list(p.liker_id.values_list("user_id", flat=True)),
-            "poster_id": p.poster_id.user_id,
-        }
-        
-        if p.repost_id:
-            data["repost_id"] = p.repost_id.post_id
-        
-        posts_list.append(data)
+MAX_BATCH_IDS = 100
+BATCH_INCLUDE = ("likers", "poster", "repost")
+
+def _batch_params(request):
+    if request.method == "GET":
+        ids = _parse_ids(request.GET.get("ids", ""))
+        return ids, request.GET.get("fields"), request.GET.get("include")
+    
+    try:
+        body = json.loads(request.body)
+    except ValueError:
+        raise ValueError("Body must be JSON")
+    if not isinstance(body, dict):
+        raise ValueError("Body must be an object with an ids list")
+    ids = body.get("ids")
+    if not isinstance(ids, list) or not all(
+        isinstance(i, int) and not isinstance(i, bool) and 0 <= i <= MAX_POST_ID for i in ids
+    ):
+        ids = None
+    fields, include = body.get("fields"), body.get("include")
+    for value in (fields, include):
+        if value is not None and not (isinstance(value, list) and all(isinstance(v, str) for v in value)):
+            raise ValueError("fields and include must be lists of names")
+    return ids, ",".join(fields) if fields is not None else None, ",".join(include) if include is not None else None
+
+# GET /api/posts/batch?ids=3,1,2 or POST {"ids": [3, 1, 2]}: the posts in
+# the order asked for, with poster and repost joined into one query and
+# the likers of all of them in a second one.
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+async def get_post_batch_json(request):
+    try:
+        ids, fields, include = _batch_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if ids is None:
+        return JsonResponse({'error': 'ids must be a list of post ids'}, status=400)
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > MAX_BATCH_IDS:
+        return JsonResponse({'error': f'At most {MAX_BATCH_IDS} ids per request'}, status=400)
     
-    max_post = request.GET.get('max_post', "5")
+    fields = [name.strip() for name in (fields or "").split(",") if name.strip()]
+    include = [name.strip() for name in include.split(",") if name.strip()] if include is not None else BATCH_INCLUDE
+    try:
+        serializer = PostSerializer(fields=fields or None, include=include)
+    except InvalidFields as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    rows = {
+        serializer.value(row, "post_id"): row
+        async for row in serializer.rows(Post.objects.filter(pk__in=ids))
+    }
+    found = [rows[post_id] for post_id in ids if post_id in rows]
+    
+    return JsonResponse({
+        "posts": await serializer.aserialize(found),
+        "missing": [post_id for post_id in ids if post_id not in rows],
+    })
+
+def _parse_max_post(request, default=5, maximum=5):
+    max_post = request.GET.get('max_post', str(default))
     if not max_post.isdecimal():
-        max_post = 5
-    elif int(max_post) > 5:
-        max_post = 5
-    else:
-        max_post = int(max_post)
-        
+        return default
+    return min(int(max_post), maximum)
+
+# Keeps page * max_post inside SQLite's integer range; any page past the
+# last post is empty anyway.
+MAX_PAGE = 10 ** 9
+
+def _parse_page(request):
     page = request.GET.get('page', "0")
     if not page.isdecimal():
-        page = 0
-    elif int(page) < 0:
-        page = 0
-    else:
-        page = int(page)
+        return 0
+    return min(int(page), MAX_PAGE)
+
+async def _all_post_versions(request):
+    """(post_id, updated_at) of the page /api/posts is asked for, plus the post count in page mode."""
+    if not hasattr(request, "_all_post_versions"):
+        versions = Post.objects.active().values_list("post_id", "updated_at")
+        max_post = _parse_max_post(request)
+        post_count = None
+        if "after" in request.GET or "before" in request.GET:
+            try:
+                rows, _ = await apaginate_keyset(
+                    versions, after=request.GET.get("after"), before=request.GET.get("before"), limit=max_post
+                )
+            except InvalidCursor:
+                rows = None
+        else:
+            page = _parse_page(request)
+            rows = [row async for row in versions[page*max_post:(page+1)*max_post]]
+            post_count = await Post.objects.active().acount()
+        request._all_post_versions = (rows, post_count)
+    return request._all_post_versions
+
+async def _all_post_validators(request):
+    rows, post_count = await _all_post_versions(request)
+    if rows is None:
+        return None, None
+    fingerprint = repr((rows, post_count, sorted(request.GET.items())))
+    etag = f'"{hashlib.md5(fingerprint.encode()).hexdigest()}"'
+    # No Last-Modified: the newest updated_at of the page doesn't move when
+    # a post is added or one on the page is deleted, so If-Modified-Since
+    # would get a 304 for a stale page. The ETag covers both.
+    return etag, None
+
+@acondition(_all_post_validators)
+async def get_all_post_json(request):
+    max_post = _parse_max_post(request)
+    try:
+        serializer = PostSerializer.from_request(request, required=("created_at",))
+    except InvalidFields as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    # Cursor mode: passing `after` or `before` (empty for the newest page)
+    # seeks on the (created_at, post_id) index instead of counting rows.
+    if "after" in request.GET or "before" in request.GET:
+        after = request.GET.get("after")
+        before = request.GET.get("before")
+        try:
+            rows, has_more = await apaginate_keyset(
+                serializer.rows(Post.objects.active()), after=after, before=before, limit=max_post
+            )
+        except InvalidCursor:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+        
+        next_cursor = previous_cursor = None
+        if rows:
+            first, last = rows[0], rows[-1]
+            if has_more or before:
+                next_cursor = encode_post_cursor(serializer.value(last, "created_at"), serializer.value(last, "post_id"))
+            if (has_more and before) or after:
+                previous_cursor = encode_post_cursor(serializer.value(first, "created_at"), serializer.value(first, "post_id"))
+        
+        return JsonResponse({
+            "posts": await serializer.aserialize(rows),
+            "next": next_cursor,
+            "previous": previous_cursor,
+        })
+        
+    page = _parse_page(request)
+    
+    _, post_count = await _all_post_versions(request)
+    rows = [row async for row in serializer.rows(Post.objects.active())[page*max_post:(page+1)*max_post]]
     
     return JsonResponse({
         "total_post": post_count,
-        "posts": posts_list[page*max_post:(page+1)*max_post]
-    })
\ No newline at end of file
+        "posts": await serializer.aserialize(rows)
+    })
+
+async def get_trending_post_json(request):
+    max_post = _parse_max_post(request, default=10, maximum=50)
+    try:
+        serializer = PostSerializer.from_request(request)
+    except InvalidFields as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    rows = [row async for row in serializer.rows(trending.trending_posts(limit=max_post))]
+    return JsonResponse({
+        "posts": await serializer.aserialize(rows),
+    })
+
+MAX_NEARBY_RADIUS_KM = 100
+MAX_NEARBY_POSTS = 100
+
+def _parse_float(value, minimum, maximum):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not minimum <= value <= maximum:
+        return None
+    return value
+
+def get_nearby_post_json(request):
+    try:
+        serializer = PostSerializer.from_request(request)
+    except InvalidFields as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    lat = _parse_float(request.GET.get("lat"), -90, 90)
+    lon = _parse_float(request.GET.get("lon"), -180, 180)
+    radius = _parse_float(request.GET.get("radius", "10"), 0, MAX_NEARBY_RADIUS_KM)
+    if lat is None or lon is None or radius is None:
+        return JsonResponse({'error': f'lat, lon and radius (up to {MAX_NEARBY_RADIUS_KM} km) are required'}, status=400)
+    
+    limit = request.GET.get("limit", "20")
+    limit = min(int(limit), MAX_NEARBY_POSTS) if limit.isdecimal() else 20
+    
+    # Coarse filter in SQL: geohash cells covering the bounding box (range
+    # scans on the indexed column) plus the box itself, then exact distances
+    # for the few candidates left.
+    lat_range, lon_ranges = bounding_box(lat, lon, radius)
+    in_cells = Q()
+    for cell in covering_geohashes(lat_range, lon_ranges):
+        in_cells |= Q(loc_geohash__gte=cell, loc_geohash__lt=cell + "~")
+    in_box = Q()
+    for lon_range in lon_ranges:
+        in_box |= Q(loc_lon__range=lon_range)
+    candidates = Post.objects.active().filter(in_cells, in_box, loc_lat__range=lat_range).values_list("post_id", "loc_lat", "loc_lon")
+    
+    nearby = list()
+    for post_id, post_lat, post_lon in candidates:
+        distance = haversine_km(lat, lon, post_lat, post_lon)
+        if distance <= radius:
+            nearby.append((distance, post_id))
+    nearby = heapq.nsmallest(limit, nearby)
+    
+    rows = serializer.rows(Post.objects.filter(pk__in=[post_id for _, post_id in nearby]))
+    rows = {serializer.value(row, "post_id"): row for row in rows}
+    posts_list = serializer.serialize([rows[post_id] for _, post_id in nearby])
+    for data, (distance, _) in zip(posts_list, nearby):
+        data["distance_km"] = round(distance, 3)
+    
+    return JsonResponse({"posts": posts_list})
+
+MAX_SEARCH_POSTS = 20
+
+def search_post_json(request):
+    try:
+        serializer = PostSerializer.from_request(request)
+    except InvalidFields as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    query = request.GET.get("q", "")
+    max_post = _parse_max_post(request, default=10, maximum=MAX_SEARCH_POSTS)
+    try:
+        results = search.search_posts(query, limit=max_post, after=request.GET.get("after"))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    next_cursor = None
+    if results and len(results) == max_post:
+        post_id, rank, _ = results[-1]
+        next_cursor = encode_cursor(rank, post_id)
+    
+    rows = serializer.rows(Post.objects.active().filter(pk__in=[post_id for post_id, _, _ in results]))
+    rows = {serializer.value(row, "post_id"): row for row in rows}
+    # The index also lists banned posts, and can briefly list a post deleted
+    # in a concurrent transaction.
+    results = [r for r in results if r[0] in rows]
+    posts_list = serializer.serialize([rows[post_id] for post_id, _, _ in results])
+    for data, (_, rank, snippet) in zip(posts_list, results):
+        data["rank"] = rank
+        data["snippet"] = snippet
+    
+    return JsonResponse({
+        "posts": posts_list,
+        "next": next_cursor,
+    })
+
+def _parse_since(request):
+    since_id = request.GET.get("since_id")
+    if since_id is not None:
+        if not since_id.isdecimal():
+            raise ValueError("since_id must be a post id")
+        since_id = int(since_id)
+    
+    since = request.GET.get("since")
+    if since is not None:
+        since = parse_datetime(since)
+        if since is None:
+            raise ValueError("since must be an ISO 8601 datetime")
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+    
+    return since_id, since
+
+# Analytics jobs authenticate with Authorization: Bearer <EXPORT_TOKEN>.
+# ?all=1 includes banned posts.
+@staff_or_token("EXPORT_TOKEN")
+def export_post_ndjson(request):
+    try:
+        since_id, since = _parse_since(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    # Under ASGI a sync iterator would be read into memory in one go before
+    # anything is sent, so the async ORM streams the export there.
+    export = aexport_posts if isinstance(request, ASGIRequest) else export_posts
+    return StreamingHttpResponse(
+        export(since_id=since_id, since=since, all_posts=request.GET.get("all") == "1"),
+        content_type="application/x-ndjson",
+    )
+
+@login_required
+@require_POST
+def ingest_json(request):
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff only'}, status=403)
+    
+    try:
+        batch = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Body must be JSON'}, status=400)
+    
+    try:
+        result = ingest(batch)
+    except IngestError as e:
+        return JsonResponse({'error': 'Invalid batch', 'rows': e.errors}, status=400)
+    
+    return JsonResponse(result, status=201)
+
+MAX_THREAD_DEPTH = 10
+MAX_THREAD_FANOUT = 50
+
+def get_thread_json(request, post_id):
+    depth = request.GET.get("depth", "5")
+    depth = min(int(depth), MAX_THREAD_DEPTH) if depth.isdecimal() else 5
+    fanout = request.GET.get("fanout", "20")
+    fanout = min(int(fanout), MAX_THREAD_FANOUT) if fanout.isdecimal() else 20
+    
+    thread = threads.get_thread(post_id, depth=depth, fanout=fanout)
+    if thread is None:
+        return JsonResponse({'error': 'Post not found'}, status=404)
+    
+    return JsonResponse(thread)
+
+# Scraped with Authorization: Bearer <METRICS_TOKEN>.
+@staff_or_token("METRICS_TOKEN")
+def metrics_view(request):
+    return HttpResponse(metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")